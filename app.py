@@ -1,288 +1,280 @@
 import streamlit as st
 import pandas as pd
-import requests
-import os
+from html import escape
 from datetime import datetime
-import folium
-from streamlit_folium import st_folium
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Setup
-API_KEY = os.getenv("OPENWEATHER_API_KEY")
-WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
-HISTORY_CSV = "crop_history.csv"
-FEEDBACK_CSV = "feedback.csv"
-
-if not os.path.exists(HISTORY_CSV):
-    pd.DataFrame(columns=["date", "crop", "location", "soil_type", "season"]).to_csv(HISTORY_CSV, index=False)
-if not os.path.exists(FEEDBACK_CSV):
-    pd.DataFrame(columns=["crop", "suggestion", "rating", "notes"]).to_csv(FEEDBACK_CSV, index=False)
-
-# Farming-themed CSS with updated styling for dropdown visibility
-st.markdown(
-    """
-    <style>
-    .stApp {
-        background-image: linear-gradient(rgba(0, 0, 0, 0.3), rgba(0, 0, 0, 0.3)), 
-        url("https://raw.githubusercontent.com/jazima2004/Crop-Rotation-Planner/main/agri1.jpg");
-        background-size: cover;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-color: #4CAF50 !important; /* Fallback color */
-        overflow-y: auto !important; /* Ensure scrolling is enabled */
-        min-height: 100vh; /* Ensure it takes at least full viewport height */
-    }
-    
-    /* Override for sidebar to keep its text readable (not white) */
-    .stSidebar, .stSidebar * {
-        color: #000000 !important; /* Black text for sidebar */
-    }
-    /* Override for buttons to have black text */
-    .stButton>button {
-        background-color: #66BB6A; /* Lighter green for contrast with black text */
-        color: #000000 !important;
-        border-radius: 5px;
-        border: none;
-        padding: 10px;
-        width: 100%;
-        margin-bottom: 5px;
-        font-weight: bold;
-    }
-    .stButton>button:hover {
-        background-color: #5DAE61; /* Slightly darker on hover */
-    }
-    .stSidebar {
-        background-color: rgba(255, 255, 255, 0.9);
-        border-right: 2px solid #4CAF50;
-    }
-    /* Titles and headers */
-    h1, h2, .stMarkdown h1, .stMarkdown h2, .stMarkdown h1 *, .stMarkdown h2 * {
-        color: #FFFFFF !important;
-        text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
-    }
-    /* Subtext and general text (e.g., st.write) */
-    .stMarkdown p, .stMarkdown div, .stMarkdown p *, .stMarkdown div * {
-        color: #FFFFFF !important;
-    }
-    /* Input labels */
-    .stSelectbox label, .stTextInput label, .stTextArea label, .stRadio label,
-    .stSelectbox label *, .stTextInput label *, .stTextArea label *, .stRadio label * {
-        color: #FFFFFF !important;
-    }
-    /* Text input text (light green background) */
-    .stTextInput input {
-        color: #000000 !important; /* Black text for readability */
-        background-color: #FFFFFF !important; /* Light green background */
-        border: 1px solid #4CAF50 !important;
-        border-radius: 5px;
-        padding: 5px;
-    }
-    /* Dropdown (selectbox) styling for better visibility */
-    .stSelectbox select {
-        color: #000000 ; /* Black text for selected option */
-        background-color:#000000; /* Light green background */
-        border: 2px solid #4CAF50; /* Thicker border for visibility */
-        border-radius: 5px;
-        padding: 5px;
-        box-shadow: 0 2px 5px rgba(0, 0, 0, 0.6) ; /* Shadow for lifted effect */
-        transition: background-color 0.2s ease; /* Smooth transition for hover */
-    }
-    /* Hover effect for dropdown */
-    .stSelectbox select:hover {
-        background-color: #80DE80 !important; /* Slightly darker light green on hover */
-    }
-    /* Style the expanded options list container */
-    .stSelectbox div[role="listbox"] {
-        background-color: #90EE90 !important; /* Light green background for the options list */
-        border: 1px solid #4CAF50 !important;
-        border-radius: 5px;
-        box-shadow: 0 2px 5px rgba(0, 0, 0, 0.2) !important; /* Shadow for the dropdown list */
-        z-index: 1000 !important; /* Ensure the options list is above other elements */
-    }
-    /* Style for individual options */
-    .stSelectbox select option {
-        color: #000000 !important; /* Black text for dropdown options */
-        background-color: #90EE90 !important; /* Light green background for options */
-        padding: 5px;
-    }
-    /* Hover effect for options */
-    .stSelectbox select option:hover {
-        background-color: #80DE80 !important; /* Slightly darker light green on hover */
-    }
-    /* Selected option styling */
-    .stSelectbox select option:checked {
-        color: #000000 !important; /* Black text for selected option */
-        background-color: #70CE70 !important; /* Darker light green for selected option */
-        font-weight: bold; /* Bold text for selected option */
-    }
-    /* Text area text (retained from previous fix) */
-    .stTextArea textarea {
-        color: #000000!important; /* White text for text area input */
-        background-color: rgba(255, 255, 255, 0.1) !important; /* Semi-transparent white background */
-        border: 1px solid #4CAF50 !important;
-        border-radius: 5px;
-        padding: 5px;
-    }
-    /* Placeholder text in text area */
-    .stTextArea textarea::placeholder {
-        color: #BBBBBB !important; /* Light gray placeholder text */
-    }
-    /* Messages (success, info, warning, error) */
-    .stSuccess, .stInfo, .stWarning, .stError,
-    .stSuccess *, .stInfo *, .stWarning *, .stError * {
-        color: #FFFFFF !important;
-        background-color: rgba(0, 0, 0, 0.7) !important;
-        border-radius: 5px;
-        padding: 10px;
-    }
-    /* Form submit button text (set to black) */
-    .stFormSubmitButton button {
-        color: #000000 !important;
-        background-color: #66BB6A !important; /* Match regular buttons */
-        border-radius: 5px;
-        border: none;
-        padding: 10px;
-        font-weight: bold;
-    }
-    .stFormSubmitButton button:hover {
-        background-color: #5DAE61 !important; /* Match regular buttons */
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
+from crop_rotation.climate import classify
+from crop_rotation.export import FORMATS as EXPORT_FORMATS
+from crop_rotation.metrics import METRICS, span, timed
+from crop_rotation.service import (
+    add_crop,
+    add_feedback,
+    climate_trend,
+    export_frame,
+    export_plans,
+    get_climate,
+    get_climate_many,
+    get_climate_reading,
+    field_summary,
+    history_page,
+    history_rollups,
+    plan_frame,
+    plan_rotation,
+    reset_history,
+    rule_choices,
+    start_climate_refresher,
+    start_metrics,
+    suggest_rotation,
 )
 
-# Rotation rules with seasons
-ROTATION_RULES = {
-    "Wheat": {
-        "humid": {
-            "Sandy": {"Monsoon": ["Legumes", "Millets"], "Winter": ["Legumes"], "Summer": []},
-            "Clayey": {"Monsoon": ["Legumes", "Maize"], "Winter": ["Legumes"], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes", "Maize", "Barley"], "Winter": ["Legumes", "Barley"], "Summer": []}
-        },
-        "dry": {
-            "Sandy": {"Monsoon": ["Millets", "Sorghum"], "Winter": ["Millets"], "Summer": ["Sorghum"]},
-            "Clayey": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Millets", "Legumes"], "Winter": ["Millets"], "Summer": []}
-        },
-        "avoid": ["Wheat", "Barley"]
-    },
-    "Rice": {
-        "humid": {
-            "Sandy": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Clayey": {"Monsoon": ["Legumes", "Vegetables"], "Winter": ["Wheat"], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes", "Wheat"], "Winter": ["Wheat"], "Summer": []}
-        },
-        "dry": {
-            "Sandy": {"Monsoon": ["Millets"], "Winter": [], "Summer": []},
-            "Clayey": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []}
-        },
-        "avoid": ["Rice"]
-    },
-    "Maize": {
-        "humid": {
-            "Sandy": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Clayey": {"Monsoon": ["Legumes", "Wheat"], "Winter": ["Wheat"], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes", "Vegetables"], "Winter": ["Wheat"], "Summer": []}
-        },
-        "dry": {
-            "Sandy": {"Monsoon": ["Millets"], "Winter": [], "Summer": ["Sorghum"]},
-            "Clayey": {"Monsoon": ["Sorghum"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Millets"], "Winter": [], "Summer": []}
-        },
-        "avoid": ["Maize"]
-    },
-    "Legumes": {
-        "humid": {
-            "Sandy": {"Monsoon": ["Wheat", "Maize"], "Winter": ["Wheat"], "Summer": []},
-            "Clayey": {"Monsoon": ["Rice", "Wheat"], "Winter": ["Wheat"], "Summer": []},
-            "Loamy": {"Monsoon": ["Wheat", "Maize"], "Winter": ["Wheat"], "Summer": []}
-        },
-        "dry": {
-            "Sandy": {"Monsoon": ["Millets"], "Winter": ["Wheat"], "Summer": []},
-            "Clayey": {"Monsoon": ["Sorghum"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Wheat"], "Winter": ["Wheat"], "Summer": []}
-        },
-        "avoid": ["Legumes"]
-    },
-    "Millets": {
-        "humid": {
-            "Sandy": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Clayey": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes", "Wheat"], "Winter": ["Wheat"], "Summer": []}
-        },
-        "dry": {
-            "Sandy": {"Monsoon": ["Legumes", "Sorghum"], "Winter": [], "Summer": ["Sorghum"]},
-            "Clayey": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []},
-            "Loamy": {"Monsoon": ["Legumes"], "Winter": [], "Summer": []}
-        },
-        "avoid": ["Millets"]
-    }
-}
-
-@st.cache_data
-def get_climate(city="Delhi"):
-    try:
-        response = requests.get(WEATHER_URL, params={"q": city, "appid": API_KEY, "units": "metric"})
-        response.raise_for_status()
-        data = response.json()
-        humidity = data["main"]["humidity"]
-        lat = data["coord"]["lat"]
-        lon = data["coord"]["lon"]
-        return "humid" if humidity > 50 else "dry", lat, lon, humidity, data["main"]["temp"]
-    except:
-        return "humid", 28.6139, 77.2090, None, None  # Fallback to Delhi coordinates
-
-def add_crop(crop, location, soil_type, season):
-    date = datetime.now().strftime("%Y-%m-%d")
-    new_crop = pd.DataFrame([{"date": date, "crop": crop, "location": location, "soil_type": soil_type, "season": season}])
-    new_crop.to_csv(HISTORY_CSV, mode="a", header=False, index=False)
-
-def add_feedback(crop, suggestion, rating, notes):
-    new_feedback = pd.DataFrame([{"crop": crop, "suggestion": suggestion, "rating": rating, "notes": notes}])
-    new_feedback.to_csv(FEEDBACK_CSV, mode="a", header=False, index=False)
-
-def suggest_rotation(crop, location, soil_type, season):
-    df = pd.read_csv(HISTORY_CSV)
-    feedback_df = pd.read_csv(FEEDBACK_CSV)
-    past_crops = df[df["location"] == location]["crop"].tolist()
-    climate, _, _, _, _ = get_climate(location)
+start_metrics()
+start_climate_refresher()
+METRICS.start_rerun()
 
-    if crop not in ROTATION_RULES:
-        return "Crop not supported. Try Wheat, Rice, Maize, Legumes, or Millets."
-
-    options = ROTATION_RULES[crop][climate].get(soil_type, ROTATION_RULES[crop][climate]["Loamy"]).get(season, [])
-    avoid = ROTATION_RULES[crop]["avoid"]
-    feedback_scores = feedback_df[feedback_df["crop"] == crop].groupby("suggestion")["rating"].mean().to_dict()
-    valid_options = [opt for opt in options if opt not in past_crops[-2:] and opt not in avoid]
-    if feedback_scores:
-        valid_options = sorted(valid_options, key=lambda x: feedback_scores.get(x, 0), reverse=True)
-    if not valid_options:
-        return "No suitable rotation options for this season. Try another crop or season."
-    return valid_options
+# Farming-themed CSS with updated styling for dropdown visibility
+with span("css"):
+    st.markdown(
+        """
+        <style>
+        .stApp {
+            background-image: linear-gradient(rgba(0, 0, 0, 0.3), rgba(0, 0, 0, 0.3)), 
+            url("https://raw.githubusercontent.com/jazima2004/Crop-Rotation-Planner/main/agri1.jpg");
+            background-size: cover;
+            background-position: center;
+            background-repeat: no-repeat;
+            background-color: #4CAF50 !important; /* Fallback color */
+            overflow-y: auto !important; /* Ensure scrolling is enabled */
+            min-height: 100vh; /* Ensure it takes at least full viewport height */
+        }
+        
+        /* Override for sidebar to keep its text readable (not white) */
+        .stSidebar, .stSidebar * {
+            color: #000000 !important; /* Black text for sidebar */
+        }
+        /* Override for buttons to have black text */
+        .stButton>button {
+            background-color: #66BB6A; /* Lighter green for contrast with black text */
+            color: #000000 !important;
+            border-radius: 5px;
+            border: none;
+            padding: 10px;
+            width: 100%;
+            margin-bottom: 5px;
+            font-weight: bold;
+        }
+        .stButton>button:hover {
+            background-color: #5DAE61; /* Slightly darker on hover */
+        }
+        .stSidebar {
+            background-color: rgba(255, 255, 255, 0.9);
+            border-right: 2px solid #4CAF50;
+        }
+        /* Titles and headers */
+        h1, h2, .stMarkdown h1, .stMarkdown h2, .stMarkdown h1 *, .stMarkdown h2 * {
+            color: #FFFFFF !important;
+            text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
+        }
+        /* Subtext and general text (e.g., st.write) */
+        .stMarkdown p, .stMarkdown div, .stMarkdown p *, .stMarkdown div * {
+            color: #FFFFFF !important;
+        }
+        /* Input labels */
+        .stSelectbox label, .stTextInput label, .stTextArea label, .stRadio label,
+        .stSelectbox label *, .stTextInput label *, .stTextArea label *, .stRadio label * {
+            color: #FFFFFF !important;
+        }
+        /* Text input text (light green background) */
+        .stTextInput input {
+            color: #000000 !important; /* Black text for readability */
+            background-color: #FFFFFF !important; /* Light green background */
+            border: 1px solid #4CAF50 !important;
+            border-radius: 5px;
+            padding: 5px;
+        }
+        /* Dropdown (selectbox) styling for better visibility */
+        .stSelectbox select {
+            color: #000000 ; /* Black text for selected option */
+            background-color:#000000; /* Light green background */
+            border: 2px solid #4CAF50; /* Thicker border for visibility */
+            border-radius: 5px;
+            padding: 5px;
+            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.6) ; /* Shadow for lifted effect */
+            transition: background-color 0.2s ease; /* Smooth transition for hover */
+        }
+        /* Hover effect for dropdown */
+        .stSelectbox select:hover {
+            background-color: #80DE80 !important; /* Slightly darker light green on hover */
+        }
+        /* Style the expanded options list container */
+        .stSelectbox div[role="listbox"] {
+            background-color: #90EE90 !important; /* Light green background for the options list */
+            border: 1px solid #4CAF50 !important;
+            border-radius: 5px;
+            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.2) !important; /* Shadow for the dropdown list */
+            z-index: 1000 !important; /* Ensure the options list is above other elements */
+        }
+        /* Style for individual options */
+        .stSelectbox select option {
+            color: #000000 !important; /* Black text for dropdown options */
+            background-color: #90EE90 !important; /* Light green background for options */
+            padding: 5px;
+        }
+        /* Hover effect for options */
+        .stSelectbox select option:hover {
+            background-color: #80DE80 !important; /* Slightly darker light green on hover */
+        }
+        /* Selected option styling */
+        .stSelectbox select option:checked {
+            color: #000000 !important; /* Black text for selected option */
+            background-color: #70CE70 !important; /* Darker light green for selected option */
+            font-weight: bold; /* Bold text for selected option */
+        }
+        /* Text area text (retained from previous fix) */
+        .stTextArea textarea {
+            color: #000000!important; /* White text for text area input */
+            background-color: rgba(255, 255, 255, 0.1) !important; /* Semi-transparent white background */
+            border: 1px solid #4CAF50 !important;
+            border-radius: 5px;
+            padding: 5px;
+        }
+        /* Placeholder text in text area */
+        .stTextArea textarea::placeholder {
+            color: #BBBBBB !important; /* Light gray placeholder text */
+        }
+        /* Messages (success, info, warning, error) */
+        .stSuccess, .stInfo, .stWarning, .stError,
+        .stSuccess *, .stInfo *, .stWarning *, .stError * {
+            color: #FFFFFF !important;
+            background-color: rgba(0, 0, 0, 0.7) !important;
+            border-radius: 5px;
+            padding: 10px;
+        }
+        /* Form submit button text (set to black) */
+        .stFormSubmitButton button {
+            color: #000000 !important;
+            background-color: #66BB6A !important; /* Match regular buttons */
+            border-radius: 5px;
+            border: none;
+            padding: 10px;
+            font-weight: bold;
+        }
+        .stFormSubmitButton button:hover {
+            background-color: #5DAE61 !important; /* Match regular buttons */
+        }
+        </style>
+        """,
+        unsafe_allow_html=True
+    )
 
+# folium is only imported on pages that actually render a map
 def create_map(city, climate, lat, lon, suggestions=None):
     if lat is None or lon is None:
         return None
+    import folium
+
     m = folium.Map(location=[lat, lon], zoom_start=8)
     color = "blue" if climate == "humid" else "orange"
-    popup = f"{city}<br>Climate: {climate}<br>Suggestions: {', '.join(suggestions) if suggestions else 'N/A'}"
+    popup = f"{escape(str(city))}<br>Climate: {climate}<br>Suggestions: {', '.join(suggestions) if suggestions else 'N/A'}"
     folium.Marker([lat, lon], popup=popup, icon=folium.Icon(color=color)).add_to(m)
     return m
 
+# Rendered map HTML is cached, so reruns and repeat visits reuse identical maps
+@st.cache_data(max_entries=256)
+def map_html(city, climate, lat, lon, suggestions=None):
+    with span("create_map"):
+        map_obj = create_map(city, climate, lat, lon, list(suggestions) if suggestions else None)
+        return map_obj.get_root().render() if map_obj else None
+
+def show_map(map_data):
+    suggestions = map_data["suggestions"]
+    html = map_html(
+        map_data["city"],
+        map_data["climate"],
+        map_data["lat"],
+        map_data["lon"],
+        tuple(suggestions) if isinstance(suggestions, list) else None
+    )
+    if html:
+        render_html(html)
+
+@timed("render_map")
+def render_html(html):
+    if hasattr(st, "iframe"):
+        st.iframe(html, width=700, height=400)
+    else:
+        import streamlit.components.v1 as components
+
+        components.html(html, width=700, height=400)
+
+# One client-side clustered layer for every location in the history
+@st.cache_data(max_entries=16)
+@timed("create_fields_map")
+def fields_map_html(points):
+    if points.empty:
+        return None
+    import folium
+    from folium.plugins import FastMarkerCluster
+
+    m = folium.Map(location=[points["lat"].mean(), points["lon"].mean()], zoom_start=4)
+    callback = """
+    function (row) {
+        var color = row[3] == "humid" ? "blue" : "orange";
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {color: color, radius: 6});
+        marker.bindPopup(row[2]);
+        return marker;
+    }
+    """
+    FastMarkerCluster(points[["lat", "lon", "popup", "climate"]].values.tolist(), callback=callback).add_to(m)
+    return m.get_root().render()
+
+@timed("field_points")
+def field_points(fields):
+    readings = get_climate_many(fields["location"].tolist())
+    located = [readings[loc].source != "fallback" for loc in fields["location"]]
+    fields = fields[located]
+    fields["lat"] = [readings[loc].lat for loc in fields["location"]]
+    fields["lon"] = [readings[loc].lon for loc in fields["location"]]
+    fields["climate"] = [readings[loc].climate for loc in fields["location"]]
+    fields["popup"] = (fields["location"].astype(str).map(escape) + "<br>Fields: " + fields["fields"].astype(str)
+                       + "<br>Last crop: " + fields["last_crop"].astype(str).map(escape) + "<br>Climate: " + fields["climate"])
+    return fields[["lat", "lon", "popup", "climate"]].reset_index(drop=True)
+
 def plot_suggestions(options):
     st.bar_chart(pd.DataFrame({"Crops": options, "Score": [1] * len(options)}).set_index("Crops"))
 
-def plot_history(df):
-    if df.empty:
+@timed("plot_history")
+def plot_history(rollups):
+    if not rollups["total"]:
         st.warning("No crop history available.")
     else:
-        st.dataframe(df)
-        st.line_chart(df["crop"].value_counts())
+        st.line_chart(pd.Series(dict(rollups["crop"].most_common()), name="count"))
+        by_location, by_season_soil, by_month = st.tabs(["By location", "By season and soil", "By month"])
+        by_location.bar_chart(pd.Series(dict(rollups["location"].most_common(20)), name="count"))
+        season_soil = pd.Series(rollups["season_soil"], name="count")
+        by_season_soil.dataframe(season_soil.unstack(fill_value=0).rename_axis(index="Season", columns="Soil Type"))
+        by_month.bar_chart(pd.Series(dict(sorted(rollups["month"].items())), name="count"))
+
+# Only the visible page of the history is fetched and sent to the browser
+def show_history_table(rollups):
+    seasons = sorted({season for season, _ in rollups["season_soil"]})
+    soils = sorted({soil for _, soil in rollups["season_soil"]})
+    crop_col, location_col, soil_col, season_col = st.columns(4)
+    filters = {
+        "crop": crop_col.selectbox("Crop", ["All"] + sorted(rollups["crop"]), key="history_crop"),
+        "location": location_col.text_input("Location", "", key="history_location").strip() or "All",
+        "soil_type": soil_col.selectbox("Soil Type", ["All"] + soils, key="history_soil"),
+        "season": season_col.selectbox("Season", ["All"] + seasons, key="history_season"),
+    }
+    filters = {column: value for column, value in filters.items() if value != "All"}
+    size_col, page_col = st.columns(2)
+    page_size = size_col.selectbox("Rows per page", [25, 50, 100, 250], index=1, key="history_page_size")
+    page = page_col.number_input("Page", min_value=1, value=1, step=1, key="history_page") - 1
+    frame, total = history_page(page, page_size, **filters)
+    pages = max(1, -(-total // page_size))
+    if page >= pages:
+        page = pages - 1
+        frame, total = history_page(page, page_size, **filters)
+    st.dataframe(frame, hide_index=True)
+    st.caption(f"Page {page + 1:,} of {pages:,} ({total:,} records)")
 
 # Initialize session state
 if "inputs" not in st.session_state:
@@ -296,8 +288,13 @@ if "map_data" not in st.session_state:
     st.session_state.map_data = {"city": "Delhi", "climate": "humid", "lat": 28.6139, "lon": 77.2090, "suggestions": None}
 if "suggestions" not in st.session_state:
     st.session_state.suggestions = None
+if "suggestion_context" not in st.session_state:
+    st.session_state.suggestion_context = None  # (crop, climate, soil, season) the suggestions were made for
+if "suggestion_place" not in st.session_state:
+    st.session_state.suggestion_place = None  # (location, gazetteer place) when the place was guessed
 if "page" not in st.session_state:
     st.session_state.page = "Add Crop"
+CROPS, SOILS, SEASONS = rule_choices()  # from the rule catalog, which reloads when edited
 
 # Sidebar buttons with unique keys
 st.sidebar.title("🌾 Crop Rotation Planner")
@@ -317,6 +314,7 @@ if st.sidebar.button("Real-time Climate Info", key="sidebar_climate_info"):
     st.session_state.page = "Real-time Climate Info"
 if st.sidebar.button("Location Map", key="sidebar_location_map"):
     st.session_state.page = "Location Map"
+show_perf_panel = st.sidebar.checkbox("Show performance panel", key="perf_panel")
 
 # Main content based on selected page
 st.title("Farmer's Crop Rotation Planner")
@@ -325,10 +323,10 @@ st.write("Plan sustainable crop rotations with real-time climate data!")
 # Shared inputs
 def render_inputs():
     with st.form("crop_form", clear_on_submit=False):
-        st.session_state.inputs["crop"] = st.selectbox("Current Crop", ["Wheat", "Rice", "Maize", "Legumes", "Millets"], key="crop_select")
+        st.session_state.inputs["crop"] = st.selectbox("Current Crop", CROPS, key="crop_select")
         st.session_state.inputs["location"] = st.text_input("Location", st.session_state.inputs["location"], key="location_input")
-        st.session_state.inputs["soil"] = st.selectbox("Soil Type", ["Sandy", "Clayey", "Loamy"], key="soil_select")
-        st.session_state.inputs["season"] = st.selectbox("Season", ["Monsoon", "Winter", "Summer"], key="season_select")
+        st.session_state.inputs["soil"] = st.selectbox("Soil Type", SOILS, key="soil_select")
+        st.session_state.inputs["season"] = st.selectbox("Season", SEASONS, key="season_select")
         submitted = st.form_submit_button("Submit")
     return submitted
 
@@ -353,7 +351,14 @@ elif st.session_state.page == "Get Rotation Suggestions":
             st.session_state.inputs["soil"],
             st.session_state.inputs["season"]
         )
-        climate, lat, lon, _, _ = get_climate(st.session_state.inputs["location"])
+        reading = get_climate_reading(st.session_state.inputs["location"])
+        climate, lat, lon = reading[:3]
+        st.session_state.suggestion_place = (
+            (st.session_state.inputs["location"], reading.place) if reading.match == "fuzzy" else None
+        )
+        st.session_state.suggestion_context = (
+            st.session_state.inputs["crop"], climate, st.session_state.inputs["soil"], st.session_state.inputs["season"]
+        )
         st.session_state.map_data = {
             "city": st.session_state.inputs["location"],
             "climate": climate,
@@ -366,17 +371,13 @@ elif st.session_state.page == "Get Rotation Suggestions":
             st.warning(st.session_state.suggestions)
         else:
             st.success(f"Suggested crops after {st.session_state.inputs['crop']}: {', '.join(st.session_state.suggestions)}")
+            if st.session_state.suggestion_place:
+                location, place = st.session_state.suggestion_place
+                st.info(f"Climate is for {place}, the closest known spelling of '{location}'. "
+                        "Check the location if that is not your field.")
             plot_suggestions(st.session_state.suggestions)
             if st.session_state.map_data["lat"] and st.session_state.map_data["lon"]:
-                map_obj = create_map(
-                    st.session_state.map_data["city"],
-                    st.session_state.map_data["climate"],
-                    st.session_state.map_data["lat"],
-                    st.session_state.map_data["lon"],
-                    st.session_state.map_data["suggestions"]
-                )
-                if map_obj:
-                    st_folium(map_obj, width=700, height=400, key="suggestions_map", returned_objects=[])
+                show_map(st.session_state.map_data)
 
 elif st.session_state.page == "Submit Feedback":
     st.header("Submit Feedback")
@@ -385,30 +386,59 @@ elif st.session_state.page == "Submit Feedback":
         feedback_notes = st.text_area("Feedback Notes", placeholder="e.g., Legumes worked well", key="feedback_notes")
         if st.button("Submit Feedback", key="submit_feedback"):
             rating = 1 if feedback == "Yes" else 0
-            add_feedback(st.session_state.inputs["crop"], st.session_state.suggestions[0], rating, feedback_notes)
+            # Other pages overwrite map_data and the inputs, so use what the suggestions were made for
+            crop, climate, soil, season = st.session_state.suggestion_context
+            add_feedback(crop, st.session_state.suggestions[0], rating, feedback_notes, climate, soil, season)
             st.info(f"Feedback recorded: {st.session_state.suggestions[0]} rated as {feedback}")
     else:
         st.warning("No suggestions available. Please get rotation suggestions first.")
 
 elif st.session_state.page == "Export Rotation Plan":
     st.header("Export Rotation Plan")
+    years = st.selectbox("Plan Horizon (years)", [1, 2, 3, 4, 5], index=2, key="plan_years")
+    file_format = st.selectbox("File Format", list(EXPORT_FORMATS), key="export_format")
+    fmt, extension, mime = EXPORT_FORMATS[file_format]
+    scope = st.radio("Fields", ["Current suggestion", "All fields in history"], key="export_scope", horizontal=True)
+    if scope == "All fields in history":
+        location_filter = st.text_input("Location contains", "", key="export_location")
+        crop_filter = st.multiselect("Current Crop", CROPS, key="export_crops")
+        soil_filter = st.multiselect("Soil Type", SOILS, key="export_soils")
+        season_filter = st.multiselect("Season", SEASONS, key="export_seasons")
     if st.button("Export Plan", key="export_plan"):
-        if st.session_state.suggestions and isinstance(st.session_state.suggestions, list):
-            plan = pd.DataFrame({
-                "Current Crop": [st.session_state.inputs["crop"]],
-                "Suggested Rotations": [", ".join(st.session_state.suggestions)],
-                "Date": [datetime.now().strftime("%Y-%m-%d")]
-            })
-            plan.to_csv("rotation_plan.csv", index=False)
-            with open("rotation_plan.csv", "rb") as file:
-                st.download_button("Download Plan", file, "rotation_plan.csv", key="download_plan")
-            st.success("Rotation plan exported!")
-        else:
-            st.warning("No suggestions to export. Please get rotation suggestions first.")
+        try:
+            if scope == "All fields in history":
+                with st.spinner("Planning every field..."):
+                    data, fields, rows = export_plans(
+                        fmt, years, location=location_filter, crops=crop_filter,
+                        soil_types=soil_filter, seasons=season_filter
+                    )
+                st.download_button("Download Plan", data, f"rotation_plans.{extension}", mime=mime, key="download_plan")
+                st.success(f"Exported {rows:,} plan steps for {fields:,} fields!")
+            elif st.session_state.suggestions and isinstance(st.session_state.suggestions, list):
+                plans = plan_rotation(
+                    st.session_state.inputs["crop"],
+                    st.session_state.inputs["location"],
+                    st.session_state.inputs["soil"],
+                    st.session_state.inputs["season"],
+                    years
+                )
+                if plans:
+                    plan = plan_frame(st.session_state.inputs["crop"], plans)
+                    st.dataframe(plan)
+                    st.download_button("Download Plan", export_frame(plan, fmt), f"rotation_plan.{extension}",
+                                       mime=mime, key="download_plan")
+                    st.success("Rotation plan exported!")
+                else:
+                    st.warning(f"No multi-season plan for {st.session_state.inputs['season']}; "
+                               "plans follow the Monsoon → Winter → Summer cycle.")
+            else:
+                st.warning("No suggestions to export. Please get rotation suggestions first.")
+        except ImportError as e:
+            st.error(f"{file_format} export needs the optional '{e.name}' package.")
 
 elif st.session_state.page == "View Crop History":
     st.header("View Crop History")
-    df = pd.read_csv(HISTORY_CSV)
+    rollups = history_rollups()
     climate, lat, lon, _, _ = get_climate(st.session_state.inputs["location"])
     st.session_state.map_data = {
         "city": st.session_state.inputs["location"],
@@ -417,65 +447,89 @@ elif st.session_state.page == "View Crop History":
         "lon": lon,
         "suggestions": None
     }
-    plot_history(df)
-    if st.session_state.map_data["lat"] and st.session_state.map_data["lon"]:
-        map_obj = create_map(
-            st.session_state.map_data["city"],
-            st.session_state.map_data["climate"],
-            st.session_state.map_data["lat"],
-            st.session_state.map_data["lon"],
-            st.session_state.map_data["suggestions"]
-        )
-        if map_obj:
-            st_folium(map_obj, width=700, height=400, key="history_map", returned_objects=[])
+    plot_history(rollups)
+    if rollups["total"]:
+        show_history_table(rollups)
+    if st.checkbox("Show all fields on map", key="history_all_fields") and rollups["total"]:
+        html = fields_map_html(field_points(field_summary(rollups)))
+        if html:
+            render_html(html)
+        else:
+            st.warning("No field locations could be resolved.")
+    elif st.session_state.map_data["lat"] and st.session_state.map_data["lon"]:
+        show_map(st.session_state.map_data)
 
 elif st.session_state.page == "Reset Crop History":
     st.header("Reset Crop History")
     if st.button("Reset History", key="reset_history"):
-        pd.DataFrame(columns=["date", "crop", "location", "soil_type", "season"]).to_csv(HISTORY_CSV, index=False)
+        reset_history()
         st.success("Crop history reset.")
 
 elif st.session_state.page == "Real-time Climate Info":
     st.header("Real-time Climate Info")
     city = st.text_input("Enter your city for live climate data", value=st.session_state.inputs["location"], key="climate_city")
     if st.button("Check Climate", key="check_climate"):
-        climate, lat, lon, humidity, temp = get_climate(city)
+        reading = get_climate_reading(city, live=True)
+        # What suggestions use: climate normals unless CLIMATE_MODE=live
+        used = get_climate_reading(city)
+        if reading.source == "fallback" and used.source == "offline":
+            # No live data; climate normals still place the city when the gazetteer knows it
+            reading = used._replace(error=reading.error)
+        _, lat, lon, humidity, temp = reading[:5]
         st.session_state.map_data = {
             "city": city,
-            "climate": climate,
+            "climate": used.climate,
             "lat": lat,
             "lon": lon,
             "suggestions": None
         }
+        trend = climate_trend(city)
+        if used.source == "offline":
+            basis = f"climate normals for {used.place}" + (", a guessed spelling" if used.match == "fuzzy" else "")
+        elif used.source == "fallback":
+            basis = "default location"
+        elif trend:
+            basis = f"median daily humidity over {trend[1]} days"
+        else:
+            basis = "latest weather reading"
         if humidity is not None:
             st.success(f"✅ City: {city}")
             st.write(f"🌡️ Temperature: {temp}°C")
-            st.write(f"💧 Humidity: {humidity}%")
-            st.write(f"🌱 Climate Category: **{climate.upper()}** (used for crop suggestion)")
+            st.write(f"💧 Humidity: {humidity}% (**{classify(humidity).upper()}** on its own)")
+            if trend:
+                st.write(f"📈 Median daily humidity: {trend[0]:.0f}% over the last {trend[1]} days of readings")
+            st.write(f"🌱 Climate Category used for crop suggestion: **{used.climate.upper()}** ({basis})")
+            if reading.source == "stale":
+                st.write("🕒 Showing the last known reading while it refreshes.")
+        elif reading.source == "offline":
+            st.warning(f"Failed to fetch live weather data ({reading.error}).")
+            st.write(f"🌱 Climate Category used for crop suggestion: **{used.climate.upper()}** ({basis})")
         else:
-            st.error("Failed to fetch weather data. Using default location (Delhi).")
+            st.error(f"Failed to fetch weather data ({reading.error}). Using default location (Delhi).")
     if st.session_state.map_data["lat"] and st.session_state.map_data["lon"]:
-        map_obj = create_map(
-            st.session_state.map_data["city"],
-            st.session_state.map_data["climate"],
-            st.session_state.map_data["lat"],
-            st.session_state.map_data["lon"],
-            st.session_state.map_data["suggestions"]
-        )
-        if map_obj:
-            st_folium(map_obj, width=700, height=400, key="climate_map", returned_objects=[])
+        show_map(st.session_state.map_data)
 
 elif st.session_state.page == "Location Map":
     st.header("Location Map")
     if st.session_state.map_data["lat"] and st.session_state.map_data["lon"]:
-        map_obj = create_map(
-            st.session_state.map_data["city"],
-            st.session_state.map_data["climate"],
-            st.session_state.map_data["lat"],
-            st.session_state.map_data["lon"],
-            st.session_state.map_data["suggestions"]
-        )
-        if map_obj:
-            st_folium(map_obj, width=700, height=400, key="location_map", returned_objects=[])
+        show_map(st.session_state.map_data)
     else:
         st.warning("No location data available. Please check climate or get suggestions first.")
+
+# Per-rerun timing export and optional debug panel
+METRICS.end_rerun(st.session_state.page)
+if show_perf_panel:
+    st.header("Performance (last reruns, all sessions)")
+    recent = list(METRICS.recent)[::-1]
+    st.dataframe(pd.DataFrame([
+        {
+            "time": datetime.fromtimestamp(r["ts"]).strftime("%H:%M:%S"),
+            "page": r["page"],
+            "total_ms": r["total_ms"],
+            "slowest span": max(r["spans"], key=lambda sp: sp["ms"])["span"] if r["spans"] else ""
+        }
+        for r in recent
+    ]))
+    if recent:
+        st.write(f"Spans of the last rerun ({recent[0]['page']}):")
+        st.dataframe(pd.DataFrame(recent[0]["spans"]))
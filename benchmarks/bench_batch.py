@@ -0,0 +1,73 @@
+# Throughput of suggest_rotation_batch against calling the single-field logic in a loop.
+#   python benchmarks/bench_batch.py --fields 50000 --locations 2000
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from crop_rotation.feedback import FeedbackModel  # noqa: E402
+from crop_rotation.rules import ROTATION_RULES, rotation_options, suggest_rotation_batch  # noqa: E402
+
+CROPS = list(ROTATION_RULES) + ["Cotton"]
+SOILS = ["Sandy", "Clayey", "Loamy", "Peaty"]
+SEASONS = ["Monsoon", "Winter", "Summer"]
+
+
+def climate_of(location):
+    return "humid" if zlib.crc32(location.encode()) % 2 else "dry"
+
+
+def synthetic(n_fields, n_locations, seed=0):
+    rng = np.random.default_rng(seed)
+    locations = [f"Farm {i}" for i in range(n_locations)]
+    fields = pd.DataFrame({
+        "crop": rng.choice(CROPS, n_fields),
+        "location": rng.choice(locations, n_fields),
+        "soil_type": rng.choice(SOILS, n_fields),
+        "season": rng.choice(SEASONS, n_fields),
+    })
+    history = {loc: list(rng.choice(CROPS[:-1], 2)) for loc in locations if rng.random() < 0.7}
+    model = FeedbackModel()
+    for _ in range(2000):
+        crop, suggestion = rng.choice(CROPS[:-1]), rng.choice(["Legumes", "Millets", "Wheat", "Maize", "Sorghum"])
+        model.record(crop, suggestion, int(rng.integers(0, 2)))
+    return fields, history, model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fields", type=int, default=20_000)
+    parser.add_argument("--locations", type=int, default=1_000)
+    args = parser.parse_args()
+
+    fields, history, model = synthetic(args.fields, args.locations)
+    recent_crops = lambda location: history.get(location, [])
+
+    start = time.perf_counter()
+    expected = [
+        rotation_options(row.crop, climate_of(row.location), row.soil_type, row.season,
+                         recent_crops(row.location), model.rank)
+        for row in fields.itertuples(index=False)
+    ]
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = suggest_rotation_batch(fields, climate_of, recent_crops, model)
+    batch_s = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(expected, batch["suggestions"]))
+    print(f"fields={len(fields)} locations={args.locations}")
+    print(f"loop : {loop_s:8.3f}s  {len(fields) / loop_s:12,.0f} fields/s")
+    print(f"batch: {batch_s:8.3f}s  {len(fields) / batch_s:12,.0f} fields/s  ({loop_s / batch_s:.1f}x)")
+    print(f"mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
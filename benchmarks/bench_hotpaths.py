@@ -0,0 +1,191 @@
+# Latency, throughput and peak memory of the app's hot paths (suggest_rotation,
+# add_crop, add_feedback and the View Crop History rollups + plot_history) against
+# synthetic history/feedback files, with get_climate stubbed out (no network).
+#   python benchmarks/bench_hotpaths.py --sizes 1000,100000,1000000 --save baseline.json
+#   python benchmarks/bench_hotpaths.py --sizes 1000,100000,1000000 --compare baseline.json
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+CROPS = ["Wheat", "Rice", "Maize", "Legumes", "Millets"]
+SUGGESTIONS = ["Legumes", "Millets", "Maize", "Barley", "Sorghum", "Wheat", "Vegetables", "Rice"]
+SOILS = ["Sandy", "Clayey", "Loamy"]
+SEASONS = ["Monsoon", "Winter", "Summer"]
+WRITE_CHUNK = 1_000_000
+FUNCTIONS = ["suggest_rotation", "add_crop", "add_feedback", "plot_history"]
+
+
+def stub_climate(city="Delhi"):
+    climate = "humid" if zlib.crc32(str(city).encode()) % 2 else "dry"
+    return climate, 28.6139, 77.2090, 60, 25.0
+
+
+def generate(directory, rows, locations, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Farm {i}" for i in range(locations)])
+    history = os.path.join(directory, "crop_history.csv")
+    feedback = os.path.join(directory, "feedback.csv")
+    for start in range(0, max(rows, 1), WRITE_CHUNK):
+        n = min(WRITE_CHUNK, rows - start)
+        pd.DataFrame({
+            "date": "2024-06-01",
+            "crop": rng.choice(CROPS, n),
+            "location": rng.choice(names, n),
+            "soil_type": rng.choice(SOILS, n),
+            "season": rng.choice(SEASONS, n),
+        }).to_csv(history, mode="a" if start else "w", header=not start, index=False)
+        pd.DataFrame({
+            "crop": rng.choice(CROPS, n),
+            "suggestion": rng.choice(SUGGESTIONS, n),
+            "rating": rng.integers(0, 2, n),
+            "notes": "",
+        }).to_csv(feedback, mode="a" if start else "w", header=not start, index=False)
+    return names
+
+
+def load_app():
+    import streamlit as st
+
+    from crop_rotation import service
+
+    quiet_streamlit()
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    service.reset()
+    service.get_climate = stub_climate
+    app = sys.modules.get("app")
+    app = importlib.reload(app) if app else importlib.import_module("app")
+    quiet_streamlit()
+    return app
+
+
+# Bare-mode Streamlit warns on every st.* call. Its loggers don't propagate and
+# are reset to logger.level when the config is parsed (STREAMLIT_LOGGER_LEVEL is
+# only read by `streamlit run`), so parse it first, then lower them all.
+def quiet_streamlit():
+    from streamlit import config, logger
+
+    config.get_option("logger.level")
+    logger.set_log_level(logging.ERROR)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def measure(fn, args_for, calls, memory_calls):
+    start = time.perf_counter()
+    fn(*args_for(0))
+    cold = time.perf_counter() - start
+
+    latencies = []
+    for i in range(1, calls + 1):
+        start = time.perf_counter()
+        fn(*args_for(i))
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for i in range(memory_calls):
+        fn(*args_for(i))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "cold_ms": cold * 1000,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "ops_per_s": calls / total if total else 0.0,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def bench_size(rows, args):
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        names = generate(directory, rows, args.locations)
+        os.chdir(directory)
+        try:
+            app = load_app()
+            rng = np.random.default_rng(1)
+            picks = lambda i: (CROPS[i % 5], names[rng.integers(len(names))], SOILS[i % 3], SEASONS[i % 3])
+            plot_calls = max(1, min(args.calls, args.plot_calls))
+            cases = {
+                "suggest_rotation": (app.suggest_rotation, picks, args.calls),
+                "add_crop": (app.add_crop, picks, args.calls),
+                "add_feedback": (app.add_feedback, lambda i: (CROPS[i % 5], SUGGESTIONS[i % 8], i % 2, ""), args.calls),
+                "plot_history": (lambda: app.plot_history(app.history_rollups()), lambda i: (), plot_calls),
+            }
+            for name in args.functions:
+                fn, args_for, calls = cases[name]
+                results[name] = measure(fn, args_for, calls, min(calls, args.memory_calls))
+                print(f"{rows:>10,} {name:<17} cold {results[name]['cold_ms']:9.2f}ms  "
+                      f"p50 {results[name]['p50_ms']:8.3f}ms  p95 {results[name]['p95_ms']:8.3f}ms  "
+                      f"p99 {results[name]['p99_ms']:8.3f}ms  {results[name]['ops_per_s']:10,.0f} ops/s  "
+                      f"peak {results[name]['peak_mb']:8.2f}MB", flush=True)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(current, baseline, threshold):
+    regressions = 0
+    print(f"\n{'rows':>10} {'function':<17} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for size, functions in current.items():
+        for name, metrics in functions.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            for metric in ("p50_ms", "p95_ms", "peak_mb"):
+                before, after = base[metric], metrics[metric]
+                change = (after - before) / before if before else 0.0
+                flag = " REGRESSION" if change > threshold else ""
+                regressions += bool(flag)
+                print(f"{int(size):>10,} {name:<17} {metric:<8} {before:10.3f} {after:10.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the suggestion, history and feedback hot paths")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma-separated history/feedback row counts (up to 10000000)")
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--plot-calls", type=int, default=5, help="calls for the history rollups + plot path")
+    parser.add_argument("--memory-calls", type=int, default=20)
+    parser.add_argument("--functions", default=",".join(FUNCTIONS))
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    args.functions = [f for f in args.functions.split(",") if f]
+
+    os.environ["WEATHER_CACHE"] = ""
+    results = {str(size): bench_size(size, args) for size in (int(s) for s in args.sizes.split(","))}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
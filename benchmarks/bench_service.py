@@ -0,0 +1,190 @@
+# Local load test of the JSON service (python -m crop_rotation.server): starts it
+# against a synthetic history in a temporary directory (or targets --url), runs
+# concurrent clients over a mix of endpoints and reports per-endpoint latency
+# percentiles, error counts, throughput and the server-side batch sizes.
+#   python benchmarks/bench_service.py --clients 32 --duration 10
+#   python benchmarks/bench_service.py --clients 32 --duration 10 --batch-max 1   # batching off
+import argparse
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import islice
+from urllib.parse import quote, urlparse
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+from crop_rotation.gazetteer import OfflineClimate  # noqa: E402
+
+CROPS = ["Wheat", "Rice", "Maize", "Legumes", "Millets"]
+SUGGESTIONS = ["Legumes", "Millets", "Maize", "Barley", "Sorghum", "Wheat", "Vegetables", "Rice"]
+SOILS = ["Sandy", "Clayey", "Loamy"]
+SEASONS = ["Monsoon", "Winter", "Summer"]
+DEFAULT_MIX = "suggest=70,crops=10,feedback=10,climate=5,batch=5"
+BATCH_COUNT = re.compile(r'crop_rotation_span_seconds_count\{span="http_batch",endpoint="(\w+)"\} (\d+)')
+
+
+def generate(directory, rows, cities, rng):
+    pd.DataFrame({
+        "date": "2024-06-01",
+        "crop": rng.choice(CROPS, rows),
+        "location": rng.choice(cities, rows),
+        "soil_type": rng.choice(SOILS, rows),
+        "season": rng.choice(SEASONS, rows),
+    }).to_csv(os.path.join(directory, "crop_history.csv"), index=False)
+    pd.DataFrame(columns=["crop", "suggestion", "rating", "notes"]).to_csv(
+        os.path.join(directory, "feedback.csv"), index=False)
+
+
+def start_server(directory, args):
+    env = dict(os.environ, PYTHONPATH=ROOT, WEATHER_URL="http://127.0.0.1:9/data/2.5/weather",  # no network
+               WEATHER_CACHE="", METRICS_LOG="", METRICS_PROM_FILE="")
+    command = [sys.executable, "-m", "crop_rotation.server", "--port", "0", "--batch-max", str(args.batch_max),
+               "--batch-wait-ms", str(args.batch_wait_ms)]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    process = subprocess.Popen(command, cwd=directory, env=env, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    match = re.search(r"(http://\S+)", line)
+    if not match:
+        process.kill()
+        raise SystemExit(f"server did not start: {line!r}")
+    print(line.strip())
+    return process, match.group(1)
+
+
+def request_for(kind, rng, cities, batch_fields):
+    field = lambda: {"crop": CROPS[rng.integers(5)], "location": cities[rng.integers(len(cities))],
+                     "soil_type": SOILS[rng.integers(3)], "season": SEASONS[rng.integers(3)]}
+    if kind == "suggest":
+        return "POST", "/suggest", field()
+    if kind == "crops":
+        return "POST", "/crops", field()
+    if kind == "feedback":
+        return "POST", "/feedback", {"crop": CROPS[rng.integers(5)], "suggestion": SUGGESTIONS[rng.integers(8)],
+                                     "rating": int(rng.integers(2)), "notes": ""}
+    if kind == "climate":
+        return "GET", f"/climate?city={quote(cities[rng.integers(len(cities))])}", None
+    return "POST", "/suggest/batch", {"fields": [field() for _ in range(batch_fields)]}
+
+
+# http.client rather than requests: the client shares the machine with the
+# server, so it should spend as little CPU per request as possible
+def client(url, kinds, weights, deadline, cities, args, seed, results):
+    rng = np.random.default_rng(seed)
+    target = urlparse(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        kind = kinds[rng.choice(len(kinds), p=weights)]
+        method, path, body = request_for(kind, rng, cities, args.batch_fields)
+        payload = json.dumps(body).encode() if body is not None else None
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            ok = False
+        results.append((kind, time.perf_counter() - start, ok))
+    connection.close()
+
+
+def batch_counts(url):
+    try:
+        with urlopen(url + "/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return {}
+    return {endpoint: int(count) for endpoint, count in BATCH_COUNT.findall(text)}
+
+
+def report(results, elapsed, batches):
+    summary = {}
+    print(f"\n{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'per batch':>10}")
+    for kind in sorted({kind for kind, _, _ in results}) + ["all"]:
+        rows = [r for r in results if kind == "all" or r[0] == kind]
+        latencies = np.array([latency for _, latency, _ in rows]) * 1000
+        errors = sum(not ok for _, _, ok in rows)
+        per_batch = len(rows) / batches[kind] if batches.get(kind) else None
+        summary[kind] = {
+            "requests": len(rows), "errors": errors, "rps": len(rows) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)), "per_batch": per_batch,
+        }
+        s = summary[kind]
+        print(f"{kind:<10} {s['requests']:>9,} {errors:>7,} {s['rps']:>9,.0f} {s['p50_ms']:>8.2f} "
+              f"{s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {'' if per_batch is None else f'{per_batch:10.1f}':>10}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the JSON rotation service")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights")
+    parser.add_argument("--batch-fields", type=int, default=100, help="fields per /suggest/batch request")
+    parser.add_argument("--history-rows", type=int, default=100_000)
+    parser.add_argument("--locations", type=int, default=2_000)
+    parser.add_argument("--workers", type=int, default=0, help="server workers (default: one per core)")
+    parser.add_argument("--batch-max", type=int, default=256)
+    parser.add_argument("--batch-wait-ms", type=float, default=0.0)
+    parser.add_argument("--save", help="write the summary to this JSON file")
+    args = parser.parse_args()
+
+    mix = dict(part.split("=") for part in args.mix.split(","))
+    kinds = list(mix)
+    weights = np.array([float(w) for w in mix.values()])
+    weights /= weights.sum()
+    rng = np.random.default_rng(0)
+    # Places the bundled gazetteer and normals resolve, so no request waits on the weather API
+    offline = OfflineClimate.load()
+    cities = list(islice((name for name, *_ in offline.gazetteer.places if offline.lookup(name)), args.locations))
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        url = args.url
+        if url is None:
+            generate(directory, args.history_rows, cities, rng)
+            process, url = start_server(directory, args)
+        try:
+            before = batch_counts(url)
+            results = []
+            deadline = time.perf_counter() + args.duration
+            threads = [threading.Thread(target=client, args=(url, kinds, weights, deadline, cities, args, i, results))
+                       for i in range(args.clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            after = batch_counts(url)
+            batches = {kind: after.get(kind, 0) - before.get(kind, 0) for kind in after}
+            summary = report(results, elapsed, batches)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# Concurrent-session load test of the Streamlit app. N simulated farmers each
+# drive their own AppTest session through Add Crop, Get Rotation Suggestions,
+# Submit Feedback and View Crop History at the same time, against a stub
+# weather endpoint and a synthetic history in a temporary directory. AppTest
+# swaps a process-wide Runtime on every run, so each session gets its own
+# process; they share the history/feedback files (or SQLite database) the way
+# several app workers would. Reports per-page latency percentiles and error
+# rates, then checks the stored rows for lost or corrupt writes.
+#   python benchmarks/bench_sessions.py --sessions 16 --iterations 5
+#   python benchmarks/bench_sessions.py --sessions 16 --storage sqlite --save sessions.json
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+CROPS = ["Wheat", "Rice", "Maize", "Legumes", "Millets"]
+SOILS = ["Sandy", "Clayey", "Loamy"]
+SEASONS = ["Monsoon", "Winter", "Summer"]
+PAGES = ["Add Crop", "Get Rotation Suggestions", "Submit Feedback", "View Crop History"]
+HISTORY_COLUMNS = ["date", "crop", "location", "soil_type", "season"]
+FEEDBACK_COLUMNS = ["crop", "suggestion", "rating", "notes"]
+DATE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+
+# OpenWeatherMap-shaped answers derived from the city name, after a fixed delay
+def start_weather_stub(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            city = (parse_qs(urlparse(self.path).query).get("q") or [""])[0]
+            time.sleep(latency)
+            h = zlib.crc32(city.encode()) % 100
+            body = json.dumps({"coord": {"lat": 20 + h / 10, "lon": 75 + h / 10},
+                               "main": {"humidity": h, "temp": 25.0}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="weather-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/data/2.5/weather"
+
+
+def seed_history(rows, farms, rng):
+    pd.DataFrame({
+        "date": "2024-06-01",
+        "crop": rng.choice(CROPS, rows),
+        "location": rng.choice(farms, rows),
+        "soil_type": rng.choice(SOILS, rows),
+        "season": rng.choice(SEASONS, rows),
+    }).to_csv("crop_history.csv", index=False)
+    pd.DataFrame(columns=FEEDBACK_COLUMNS).to_csv("feedback.csv", index=False)
+
+
+# Bare-mode Streamlit logs a warning per st.* call. Its loggers are reset to
+# logger.level when the config is parsed (STREAMLIT_LOGGER_LEVEL is only read
+# by `streamlit run`), so parse it first, then lower them all.
+def quiet_streamlit():
+    from streamlit import config, logger
+
+    config.get_option("logger.level")
+    logger.set_log_level(logging.ERROR)
+
+
+class Session:
+    def __init__(self, number, farm, args):
+        self.number = number
+        self.farm = farm
+        self.args = args
+        self.results = []
+        self.rng = np.random.default_rng(number)
+
+    def timed(self, page, action, check):
+        start = time.perf_counter()
+        error = None
+        try:
+            at = action()
+            if at.exception:
+                error = at.exception[0].message
+            else:
+                error = check(at)
+        except Exception:
+            error = traceback.format_exc(limit=1).strip().splitlines()[-1]
+        self.results.append((page, time.perf_counter() - start, error))
+        return error is None
+
+    def open(self, at, page):
+        return [b for b in at.sidebar.button if b.label == page][0].click().run()
+
+    def submit(self, at):
+        at.selectbox(key="crop_select").set_value(CROPS[self.rng.integers(len(CROPS))])
+        at.text_input(key="location_input").set_value(self.farm)
+        at.selectbox(key="soil_select").set_value(SOILS[self.rng.integers(len(SOILS))])
+        at.selectbox(key="season_select").set_value(SEASONS[self.rng.integers(len(SEASONS))])
+        return [b for b in at.button if b.label == "Submit"][0].click().run()
+
+    def run(self):
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=self.args.timeout)
+        if not self.timed("startup", at.run, lambda _: None):
+            return
+        for _ in range(self.args.iterations):
+            self.open(at, "Add Crop")
+            self.timed("Add Crop", lambda: self.submit(at),
+                       lambda at: None if any("Added" in e.value for e in at.success) else "no confirmation")
+
+            self.open(at, "Get Rotation Suggestions")
+            self.timed("Get Rotation Suggestions", lambda: self.submit(at),
+                       lambda at: None if at.success or at.warning else "no suggestion shown")
+
+            self.open(at, "Submit Feedback")
+            if isinstance(at.session_state["suggestions"], list):
+                self.timed("Submit Feedback", lambda: at.button(key="submit_feedback").click().run(),
+                           lambda at: None if at.info else "no confirmation")
+
+            self.timed("View Crop History", lambda: self.open(at, "View Crop History"), lambda _: None)
+
+
+def run_session(number, farm, args, barrier, results):
+    quiet_streamlit()
+    session = Session(number, farm, args)
+    barrier.wait()
+    try:
+        session.run()
+    finally:
+        results.put(session.results)
+
+
+def percentiles(values):
+    values = np.array(values) * 1000
+    return {f"p{q}_ms": float(np.percentile(values, q)) for q in (50, 95, 99)} | {"max_ms": float(values.max())}
+
+
+def report(results, elapsed):
+    summary = {}
+    print(f"\n{'page':<26} {'runs':>6} {'errors':>7} {'error %':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}")
+    for page in ["startup"] + PAGES:
+        rows = [r for r in results if r[0] == page]
+        if not rows:
+            continue
+        errors = [error for _, _, error in rows if error]
+        summary[page] = {"runs": len(rows), "errors": len(errors), "error_rate": len(errors) / len(rows),
+                         **percentiles([seconds for _, seconds, _ in rows])}
+        s = summary[page]
+        print(f"{page:<26} {s['runs']:>6,} {s['errors']:>7,} {s['error_rate']:>8.1%} {s['p50_ms']:>9.1f} "
+              f"{s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+        for error in sorted(set(errors))[:3]:
+            print(f"    {error}")
+    print(f"{len(results):,} page actions in {elapsed:.1f}s")
+    return summary
+
+
+def check_csv(path, columns, valid):
+    problems, rows = [], 0
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        if next(reader, None) != columns:
+            problems.append(f"{path}: bad header")
+        for line, row in enumerate(reader, start=2):
+            rows += 1
+            if len(row) != len(columns):
+                problems.append(f"{path}:{line}: {len(row)} fields instead of {len(columns)}")
+            elif not valid(dict(zip(columns, row))):
+                problems.append(f"{path}:{line}: unexpected values {row}")
+    return rows, problems
+
+
+# Rows on disk must be well-formed and match the writes the sessions saw succeed
+def check_storage(args, seeded, counts, farms):
+    from crop_rotation.feedback import FeedbackModel
+    from crop_rotation.history import HistoryStore
+
+    known_farms = set(farms)
+    valid_history = lambda r: (DATE.match(r["date"]) and r["crop"] in CROPS and r["location"] in known_farms
+                               and r["soil_type"] in SOILS and r["season"] in SEASONS)
+    valid_feedback = lambda r: r["crop"] in CROPS and r["rating"] in ("0", "1")
+    if args.storage == "sqlite":
+        with sqlite3.connect("crop_rotation.db") as conn:
+            problems = [f"sqlite: {row[0]}" for row in conn.execute("PRAGMA integrity_check") if row[0] != "ok"]
+            history = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            feedback = conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+            rollup = conn.execute("SELECT count FROM history_rollup WHERE dimension = 'total'").fetchone()
+            if (rollup[0] if rollup else 0) != history:
+                problems.append(f"sqlite: history_rollup total {rollup} != {history} rows")
+    else:
+        history, problems = check_csv("crop_history.csv", HISTORY_COLUMNS, valid_history)
+        feedback, feedback_problems = check_csv("feedback.csv", FEEDBACK_COLUMNS, valid_feedback)
+        problems += feedback_problems
+        indexed = HistoryStore("crop_history.csv").rollups()["total"]
+        if indexed != history:
+            problems.append(f"history index reads {indexed:,} rows, csv module reads {history:,}")
+
+    expected = {"history": seeded + counts["history"], "feedback": counts["feedback"]}
+    for name, found in (("history", history), ("feedback", feedback)):
+        if found != expected[name]:
+            problems.append(f"{name}: {found:,} rows, expected {expected[name]:,}")
+    # Every session process appends its ratings to the shared feedback journal,
+    # so a fresh load must count each rating the sessions saw succeed
+    model = FeedbackModel("feedback_model.json")
+    try:
+        model.load()
+    except (OSError, ValueError, KeyError) as exc:
+        problems.append(f"feedback model unreadable: {exc!r}")
+    trials = sum(model.counts(crop, suggestion)[1] for crop in CROPS for suggestion in model.scores(crop))
+    if round(trials) != counts["feedback"]:
+        problems.append(f"feedback model counts {trials:g} ratings, expected {counts['feedback']:,}")
+    return {"history_rows": history, "feedback_rows": feedback, "expected": expected, "problems": problems,
+            "feedback_model_ratings": trials}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated sessions through the Streamlit app")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=5, help="passes over the four pages per session")
+    parser.add_argument("--history-rows", type=int, default=10_000, help="seeded history size")
+    parser.add_argument("--farms", type=int, default=500)
+    parser.add_argument("--storage", default="csv", choices=["csv", "sqlite"])
+    parser.add_argument("--climate-mode", default="live", choices=["offline", "live"],
+                        help="live sends every lookup of the synthetic farms to the stub weather endpoint")
+    parser.add_argument("--weather-latency-ms", type=float, default=50.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per script run")
+    parser.add_argument("--save", help="write latencies, errors and the integrity report to this JSON file")
+    args = parser.parse_args()
+
+    weather, url = start_weather_stub(args.weather_latency_ms / 1000)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.environ.update(WEATHER_URL=url, CLIMATE_MODE=args.climate_mode, STORAGE_BACKEND=args.storage,
+                          STORAGE_DB="crop_rotation.db", METRICS_PORT="0")
+        try:
+            rng = np.random.default_rng(0)
+            farms = [f"Farm {i}" for i in range(args.farms)]
+            seed_history(args.history_rows, farms, rng)
+            if args.storage == "sqlite":
+                from crop_rotation.storage import SqliteBackend
+
+                SqliteBackend("crop_rotation.db").import_csv("crop_history.csv", "feedback.csv")
+
+            context = multiprocessing.get_context("spawn")
+            barrier, queue = context.Barrier(args.sessions), context.Queue()
+            processes = [context.Process(target=run_session, name=f"session-{i}",
+                                         args=(i, farms[i % len(farms)], args, barrier, queue))
+                         for i in range(args.sessions)]
+            started = time.perf_counter()
+            for process in processes:
+                process.start()
+            results = []
+            for _ in processes:
+                try:
+                    results.extend(queue.get(timeout=args.timeout * (4 * args.iterations + 1)))
+                except Empty:
+                    print("a session process stopped without reporting", file=sys.stderr)
+                    break
+            for process in processes:
+                process.join()
+            summary = report(results, time.perf_counter() - started)
+
+            # Writes the sessions saw succeed
+            counts = {"history": sum(page == "Add Crop" and not error for page, _, error in results),
+                      "feedback": sum(page == "Submit Feedback" and not error for page, _, error in results)}
+            integrity = check_storage(args, args.history_rows, counts, farms)
+            print(f"\nhistory rows {integrity['history_rows']:,} (expected {integrity['expected']['history']:,}), "
+                  f"feedback rows {integrity['feedback_rows']:,} (expected {integrity['expected']['feedback']:,})")
+            for problem in integrity["problems"][:20]:
+                print(f"CORRUPTION {problem}")
+            if not integrity["problems"]:
+                print("no corrupt or lost writes")
+        finally:
+            os.chdir(cwd)
+            weather.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"pages": summary, "integrity": integrity}, f, indent=2)
+    sys.exit(1 if integrity["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
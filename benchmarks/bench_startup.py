@@ -0,0 +1,65 @@
+# Cold import time of the app and the core package, and per-page rerun time of
+# the Streamlit script (via Streamlit's in-process AppTest).
+#   python benchmarks/bench_startup.py --imports 5 --reruns 10
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+PAGES = ["Add Crop", "Get Rotation Suggestions", "Submit Feedback", "Export Rotation Plan",
+         "View Crop History", "Real-time Climate Info", "Location Map"]
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def cold_import(module, runs, cwd, env):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)], cwd=cwd, env=env,
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples) * 1000
+
+
+def rerun_times(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120).run()
+    results = {}
+    for page in PAGES:
+        [b for b in at.sidebar.button if b.label == page][0].click().run()
+        samples = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            at.run()
+            samples.append(time.perf_counter() - start)
+        results[page] = statistics.median(samples) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import and per-rerun time")
+    parser.add_argument("--imports", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--modules", default="app,crop_rotation.service,crop_rotation.rules")
+    args = parser.parse_args()
+
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    os.environ["WEATHER_URL"] = "http://127.0.0.1:9/data/2.5/weather"  # refused at once: no network
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as directory:
+        for module in args.modules.split(","):
+            try:
+                print(f"cold import {module:<16} {cold_import(module, args.imports, directory, env):8.1f} ms")
+            except subprocess.CalledProcessError:
+                print(f"cold import {module:<16} unavailable")
+        os.chdir(directory)
+        for page, ms in rerun_times(args.reruns).items():
+            print(f"rerun {page:<26} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Offline check of the bulk weather lookup (get_climate_many) against a local
+# stub of OpenWeatherMap's /data/2.5/weather. The city name picks the stub's
+# behaviour: "ok-*" answers, "throttle-*" sends one 429 with Retry-After,
+# "flaky-*" two 503s, "missing-*" a 404 and "down-*" only 503s. Checks
+# dedupe, the concurrency limit, Retry-After, 5xx backoff, fallbacks and that
+# a failed refetch keeps serving the cached reading. Exits 1 on any failure.
+#   python benchmarks/check_climate_many.py
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+RETRY_AFTER = 1
+BACKOFF = 0.5  # get_climate_many's default
+
+
+class Stub:
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = defaultdict(list)  # city -> request times
+        self.outage = False
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def respond(self, city):
+        with self._lock:
+            self.requests[city].append(time.monotonic())
+            attempt = len(self.requests[city])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        kind = city.split("-")[0]
+        if self.outage or kind == "down" or (kind == "flaky" and attempt <= 2):
+            return 503, {}, {"cod": 503}
+        if kind == "missing":
+            return 404, {}, {"cod": "404", "message": "city not found"}
+        if kind == "throttle" and attempt == 1:
+            return 429, {"Retry-After": str(RETRY_AFTER)}, {"cod": 429}
+        h = zlib.crc32(city.encode()) % 100
+        return 200, {}, {"coord": {"lat": 20 + h / 10, "lon": 75 + h / 10}, "main": {"humidity": h, "temp": 25.0}}
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                city = (parse_qs(urlparse(self.path).query).get("q") or [""])[0]
+                status, headers, body = stub.respond(city)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="weather-stub", daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_port}/data/2.5/weather"
+
+
+def gaps(times):
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check get_climate_many against a local weather stub")
+    parser.add_argument("--cities", type=int, default=40, help="well-behaved cities in the bulk lookup")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--ttl", type=int, default=2, help="WEATHER_TTL for the stale check, seconds")
+    args = parser.parse_args()
+
+    stub = Stub(args.latency_ms / 1000)
+    server, url = stub.start()
+    os.environ.update(WEATHER_URL=url, OPENWEATHER_API_KEY="stub", CLIMATE_MODE="live", WEATHER_CACHE="",
+                      WEATHER_TTL=str(args.ttl), CLIMATE_SERIES="", METRICS_LOG="", METRICS_PROM_FILE="")
+    from crop_rotation import service
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            ok = [f"ok-{i}" for i in range(args.cities)]
+            # Same places spelled differently, plus one of each failure mode
+            cities = ok + [c.upper() for c in ok[:10]] + [f"  {c} " for c in ok[:10]] + \
+                ["throttle-1", "flaky-1", "missing-1", "down-1"]
+            started = time.monotonic()
+            readings = service.get_climate_many(cities, concurrency=args.concurrency)
+            elapsed = time.monotonic() - started
+
+            check("every input city answered", set(readings) == set(cities))
+            repeats = {city: len(times) for city, times in stub.requests.items() if city.startswith("ok") and len(times) != 1}
+            check("duplicates fetched once", not repeats and len([c for c in stub.requests if c.startswith("ok")]) == args.cities,
+                  f"{repeats}" if repeats else "")
+            check("spellings share a reading", all(readings[c.upper()] == readings[c] for c in ok[:10]))
+            check("concurrency limit", 1 < stub.max_in_flight <= args.concurrency,
+                  f"max {stub.max_in_flight} in flight, limit {args.concurrency}")
+            check("ok cities are live", all(readings[c].source == "live" for c in ok))
+
+            throttled = stub.requests["throttle-1"]
+            check("429 retried after Retry-After", readings["throttle-1"].source == "live" and len(throttled) == 2
+                  and gaps(throttled)[0] >= RETRY_AFTER, f"{len(throttled)} requests, gaps {gaps(throttled)}")
+            flaky = stub.requests["flaky-1"]
+            backoffs = gaps(flaky)
+            check("5xx retried with exponential backoff", readings["flaky-1"].source == "live" and len(flaky) == 3
+                  and backoffs[0] >= BACKOFF and backoffs[1] >= 2 * BACKOFF, f"gaps {[round(g, 2) for g in backoffs]}")
+            check("404 fails without retrying", readings["missing-1"].source == "fallback"
+                  and readings["missing-1"].error == "HTTP 404" and len(stub.requests["missing-1"]) == 1)
+            check("persistent 5xx falls back after retries", readings["down-1"].source == "fallback"
+                  and readings["down-1"].error == "HTTP 503" and len(stub.requests["down-1"]) == 4)
+            print(f"     bulk lookup of {len(cities)} names took {elapsed:.2f}s")
+
+            time.sleep(args.ttl + 0.1)
+            stub.outage = True
+            during = service.get_climate_many(ok[:5], concurrency=args.concurrency)
+            check("failed refetch serves the cached reading", all(during[c].source == "stale" for c in ok[:5]),
+                  ", ".join(sorted({r.source for r in during.values()})))
+            check("stale reading unchanged", all(during[c][:5] == readings[c][:5] for c in ok[:5]))
+            after = service.get_climate_reading(ok[0], live=True)
+            check("failed refetch is not negative-cached", after.source == "stale", after.source)
+        finally:
+            service.reset()
+            server.shutdown()
+            os.chdir(cwd)
+
+    print(f"\n{len(failures)} failed" if failures else "\nall checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
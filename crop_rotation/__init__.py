@@ -0,0 +1,30 @@
+# Core crop rotation logic (rules, history, feedback, climate) without any UI
+# dependencies; app.py is the Streamlit front end on top of it. Names are
+# resolved lazily so importing one submodule does not pull in the others.
+import importlib
+
+_EXPORTS = {
+    "ROTATION_RULES": "rules",
+    "RuleCatalog": "rules",
+    "compile_rules": "rules",
+    "load_catalog": "rules",
+    "rotation_options": "rules",
+    "add_crop": "service",
+    "add_feedback": "service",
+    "get_climate": "service",
+    "get_climate_many": "service",
+    "get_climate_reading": "service",
+    "plan_rotation": "service",
+    "read_history": "service",
+    "reset_history": "service",
+    "suggest_rotation": "service",
+    "suggest_rotation_batch": "service",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
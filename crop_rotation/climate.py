@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+FALLBACK = ("humid", 28.6139, 77.2090, None, None)  # Delhi
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# The first five fields are what get_climate has always returned; source is
+# "live", "cache", "stale", "fallback" or "offline" and error explains a
+# fallback. Offline readings also name the gazetteer place and how it was
+# matched ("exact", "alias" or "fuzzy" for a guessed spelling).
+ClimateReading = namedtuple("ClimateReading", ["climate", "lat", "lon", "humidity", "temp", "source", "error",
+                                               "place", "match"], defaults=(None, None))
+
+
+def classify(humidity):
+    return "humid" if humidity > 50 else "dry"
+
+
+# Error text shown to users; never includes the request URL, which carries the API key
+def describe_error(exc):
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return f"HTTP {exc.response.status_code}"
+    if isinstance(exc, requests.Timeout):
+        return "request timed out"
+    if isinstance(exc, requests.ConnectionError):
+        return "connection failed"
+    return str(exc) if isinstance(exc, RuntimeError) else type(exc).__name__
+
+
+def _normalise(city):
+    return " ".join(str(city).split()).lower()
+
+
+# OpenWeatherMap client with a pooled session, timeouts, a bounded LRU+TTL
+# memory cache backed by a JSON file on disk, and stale-while-revalidate:
+# an expired entry is served immediately while one background refresh runs.
+# on_reading(key, reading, fetched_at) is called for every fresh API reading.
+class WeatherClient:
+    def __init__(self, api_key, url=WEATHER_URL, ttl=1800, stale_ttl=86400, failure_ttl=60,
+                 max_entries=2048, disk_path="weather_cache.json", timeout=(3.05, 10), pool_size=16,
+                 on_reading=None):
+        self.api_key = api_key
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.timeout = timeout
+        self.on_reading = on_reading
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "fallbacks": 0, "requests": 0}
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather-refresh")
+        self._errors = {}
+        self._rate_lock = threading.Lock()
+        self._next_slot = 0.0
+        self._load_disk()
+
+    def _load_disk(self):
+        if not self.disk_path or not os.path.exists(self.disk_path):
+            return
+        try:
+            with open(self.disk_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, (fetched_at, reading) in sorted(entries.items(), key=lambda item: item[1][0]):
+            self._cache[key] = (fetched_at, tuple(reading))
+        self._evict()
+
+    def _save_disk(self):
+        if not self.disk_path:
+            return
+        with self._lock:
+            entries = {k: v for k, v in self._cache.items() if v[1] is not None}
+        tmp = f"{self.disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.disk_path)
+
+    def _evict(self):
+        while len(self._cache) > self.max_entries:
+            key, _ = self._cache.popitem(last=False)
+            self._errors.pop(key, None)
+
+    def _store(self, key, reading, now):
+        with self._lock:
+            self._cache[key] = (now, reading)
+            if reading is not None:
+                self._errors.pop(key, None)
+            self._cache.move_to_end(key)
+            self._evict()
+        if reading is not None and self.on_reading is not None:
+            self.on_reading(key, reading, now)
+
+    def fetch(self, city):
+        if not self.api_key:
+            raise RuntimeError("OPENWEATHER_API_KEY is not set")
+        self.stats["requests"] += 1
+        response = self.session.get(
+            self.url, params={"q": city, "appid": self.api_key, "units": "metric"}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        humidity = data["main"]["humidity"]
+        return classify(humidity), data["coord"]["lat"], data["coord"]["lon"], humidity, data["main"]["temp"]
+
+    def _refresh(self, key, city):
+        try:
+            reading = self.fetch(city)
+        except (requests.RequestException, RuntimeError, KeyError, ValueError):
+            return None
+        else:
+            self._store(key, reading, time.time())
+            self._save_disk()
+            return reading
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _revalidate(self, key, city):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._refresher.submit(self._refresh, key, city)
+
+    def lookup(self, city="Delhi"):
+        key = _normalise(city)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+        if entry is not None:
+            fetched_at, reading = entry
+            age = now - fetched_at
+            # reading is None for a recently failed lookup (negative cache)
+            if reading is None and age < self.failure_ttl:
+                self.stats["fallbacks"] += 1
+                return ClimateReading(*FALLBACK, "fallback", self._errors.get(key, "recent lookup failed"))
+            if reading is not None and age < self.ttl:
+                self.stats["hits"] += 1
+                return ClimateReading(*reading, "cache", None)
+            if reading is not None and age < self.stale_ttl:
+                self.stats["stale"] += 1
+                self._revalidate(key, city)
+                return ClimateReading(*reading, "stale", None)
+
+        self.stats["misses"] += 1
+        try:
+            reading = self.fetch(city)
+        except (requests.RequestException, RuntimeError, KeyError, ValueError) as exc:
+            error = self._errors[key] = describe_error(exc)
+            self._store(key, None, now)
+            self.stats["fallbacks"] += 1
+            return ClimateReading(*FALLBACK, "fallback", error)
+        self._store(key, reading, now)
+        self._save_disk()
+        return ClimateReading(*reading, "live", None)
+
+    def _wait_for_slot(self, min_interval):
+        if not min_interval:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    # Retries throttling (429, honouring Retry-After), 5xx and connection
+    # errors with exponential backoff; anything else fails immediately.
+    def _fetch_with_retry(self, city, retries, backoff, min_interval):
+        for attempt in range(retries + 1):
+            self._wait_for_slot(min_interval)
+            try:
+                return self.fetch(city)
+            except requests.HTTPError as exc:
+                status = exc.response.status_code if exc.response is not None else None
+                if status not in RETRY_STATUSES or attempt == retries:
+                    raise
+                retry_after = exc.response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt
+            time.sleep(delay)
+
+    # Bulk lookup that dedupes cities, serves fresh cache entries directly and
+    # fetches the rest concurrently into the same cache lookup() reads from.
+    # Like lookup(), a failed refetch of a reading still within stale_ttl
+    # serves it as "stale" and keeps it cached instead of negative-caching.
+    def lookup_many(self, cities, concurrency=8, retries=3, backoff=0.5, max_rps=None):
+        by_key = {}
+        for city in cities:
+            by_key.setdefault(_normalise(city), city)
+        results = {}
+        pending = {}
+        stale = {}
+        now = time.time()
+        with self._lock:
+            for key, city in by_key.items():
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] is not None and now - entry[0] < self.ttl:
+                    self._cache.move_to_end(key)
+                    results[key] = ClimateReading(*entry[1], "cache", None)
+                else:
+                    pending[key] = city
+                    if entry is not None and entry[1] is not None and now - entry[0] < self.stale_ttl:
+                        stale[key] = entry[1]
+        self.stats["hits"] += len(results)
+        self.stats["misses"] += len(pending)
+
+        min_interval = 1.0 / max_rps if max_rps else None
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pending)))) as pool:
+                futures = {
+                    pool.submit(self._fetch_with_retry, city, retries, backoff, min_interval): key
+                    for key, city in pending.items()
+                }
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        reading = future.result()
+                    except (requests.RequestException, RuntimeError, KeyError, ValueError) as exc:
+                        if key in stale:
+                            self.stats["stale"] += 1
+                            results[key] = ClimateReading(*stale[key], "stale", None)
+                            continue
+                        error = describe_error(exc)
+                        with self._lock:
+                            self._errors[key] = error
+                        self._store(key, None, time.time())
+                        self.stats["fallbacks"] += 1
+                        results[key] = ClimateReading(*FALLBACK, "fallback", error)
+                    else:
+                        self._store(key, reading, time.time())
+                        results[key] = ClimateReading(*reading, "live", None)
+            self._save_disk()
+        return {city: results[_normalise(city)] for city in cities}
+
+    def close(self):
+        self._refresher.shutdown(wait=False)
+        self.session.close()
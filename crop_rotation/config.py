@@ -0,0 +1,45 @@
+import os
+
+from dotenv import load_dotenv
+
+from .climate import WEATHER_URL
+from .gazetteer import GAZETTEER_PATH, NORMALS_PATH
+from .rules import RULES_PATH
+
+# Load environment variables
+load_dotenv()
+
+API_KEY = os.getenv("OPENWEATHER_API_KEY")
+WEATHER_URL = os.getenv("WEATHER_URL", WEATHER_URL)
+WEATHER_CACHE = os.getenv("WEATHER_CACHE", "weather_cache.json")
+WEATHER_TTL = int(os.getenv("WEATHER_TTL", "1800"))  # seconds before a reading is refreshed
+WEATHER_CONCURRENCY = int(os.getenv("WEATHER_CONCURRENCY", "8"))
+CLIMATE_MODE = os.getenv("CLIMATE_MODE", "offline")  # "offline" (gazetteer + normals, API for misses) or "live"
+CLIMATE_SERIES = os.getenv("CLIMATE_SERIES", "climate_series.json")  # rolling humidity history; empty keeps it in memory
+CLIMATE_WINDOW_DAYS = int(os.getenv("CLIMATE_WINDOW_DAYS", "90"))  # median window for humid/dry; 0 uses the latest reading
+CLIMATE_RETENTION_DAYS = int(os.getenv("CLIMATE_RETENTION_DAYS", "365"))  # daily means kept per location
+CLIMATE_MIN_DAYS = int(os.getenv("CLIMATE_MIN_DAYS", "3"))  # days of readings before the median is used
+CLIMATE_SAMPLE_INTERVAL = int(os.getenv("CLIMATE_SAMPLE_INTERVAL", "3600"))  # background sampling; 0 disables
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", GAZETTEER_PATH)
+CLIMATE_NORMALS_PATH = os.getenv("CLIMATE_NORMALS_PATH", NORMALS_PATH)
+RULES_PATH = os.getenv("RULES_PATH", RULES_PATH)  # JSON or YAML rule catalog, reloaded when it changes
+RULES_REGION = os.getenv("RULES_REGION") or None  # apply this regional variant from the catalog
+HISTORY_CSV = "crop_history.csv"
+FEEDBACK_CSV = "feedback.csv"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")  # "csv" or "sqlite"
+STORAGE_DB = os.getenv("STORAGE_DB", "crop_rotation.db")
+FEEDBACK_MODEL = os.getenv("FEEDBACK_MODEL", "feedback_model.json")
+FEEDBACK_RANKING = os.getenv("FEEDBACK_RANKING", "mean")  # "mean", "beta" or "thompson"
+FEEDBACK_HALF_LIFE_DAYS = float(os.getenv("FEEDBACK_HALF_LIFE_DAYS", "0")) or None
+FEEDBACK_BY_CONTEXT = os.getenv("FEEDBACK_BY_CONTEXT", "0") == "1"
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "0")) or os.cpu_count() or 1
+SERVICE_BATCH_MAX = int(os.getenv("SERVICE_BATCH_MAX", "256"))  # single requests coalesced per call
+SERVICE_BATCH_WAIT_MS = float(os.getenv("SERVICE_BATCH_WAIT_MS", "0"))  # extra wait for a batch to fill
+METRICS_LOG = os.getenv("METRICS_LOG", "")  # one JSON line per rerun (e.g. metrics.jsonl); empty disables
+METRICS_LOG_MAX_MB = float(os.getenv("METRICS_LOG_MAX_MB", "50"))  # rotated to METRICS_LOG.1 past this size
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "metrics.prom")  # Prometheus text format; empty disables
+METRICS_PROM_INTERVAL = float(os.getenv("METRICS_PROM_INTERVAL", "15"))  # seconds between writes of the file
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serve /metrics on this port when set
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # 0.0.0.0 exposes /metrics on every interface
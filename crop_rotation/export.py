@@ -0,0 +1,117 @@
+import pandas as pd
+
+from .planner import SEASON_CYCLE
+
+EXPORT_CHUNK = 5_000
+EXCEL_MAX_ROWS = 1_048_575  # per sheet, after the header row
+FIELD_COLUMNS = ["location", "crop", "soil_type", "season"]
+PLAN_COLUMNS = ["Location", "Soil Type", "Current Season", "Current Crop", "Plan", "Plan Score", "Year", "Season",
+                "Crop", "Date"]
+# Label shown in the app -> (writer format, file extension, MIME type)
+FORMATS = {
+    "CSV": ("csv", "csv", "text/csv"),
+    "Parquet": ("parquet", "parquet", "application/vnd.apache.parquet"),
+    "Excel": ("excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def format_for_path(path):
+    for fmt, extension, _ in FORMATS.values():
+        if path.endswith(f".{extension}"):
+            return fmt
+    return "csv"
+
+
+# Writes DataFrames one chunk at a time to a path or a binary file object (e.g.
+# io.BytesIO), so only the current chunk is held as a frame. Parquet needs
+# pyarrow and Excel needs openpyxl; both are imported on first use.
+class PlanWriter:
+    def __init__(self, target, fmt="csv"):
+        if fmt not in ("csv", "parquet", "excel"):
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.fmt = fmt
+        self._owned = isinstance(target, str)
+        self._file = open(target, "wb") if self._owned else target
+        self._parquet = None
+        self._workbook = None
+        self._sheet = None
+        self._sheet_rows = 0
+        self._columns = None
+        self.rows = 0
+
+    def write(self, frame):
+        if self._columns is None:
+            self._columns = list(frame.columns)
+        if self.fmt == "parquet":
+            self._write_parquet(frame)
+        elif self.fmt == "excel":
+            self._write_excel(frame)
+        else:
+            self._file.write(frame.to_csv(index=False, header=not self.rows).encode("utf-8"))
+        self.rows += len(frame)
+
+    def _write_parquet(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self._file, table.schema)
+        self._parquet.write_table(table)
+
+    # Write-only workbooks keep rows out of memory until save()
+    def _write_excel(self, frame):
+        if self._workbook is None:
+            from openpyxl import Workbook
+
+            self._workbook = Workbook(write_only=True)
+        for row in frame.itertuples(index=False, name=None):
+            if self._sheet is None or self._sheet_rows >= EXCEL_MAX_ROWS:
+                self._sheet = self._workbook.create_sheet(f"Plans {len(self._workbook.worksheets) + 1}")
+                self._sheet.append(self._columns)
+                self._sheet_rows = 0
+            self._sheet.append(row)
+            self._sheet_rows += 1
+
+    def close(self, columns=None):
+        if self._columns is None and columns is not None:
+            self.write(pd.DataFrame(columns=columns))  # header only
+        if self._workbook is not None:
+            if self._sheet is None:
+                self._sheet = self._workbook.create_sheet("Plans 1")
+                self._sheet.append(self._columns)
+            self._workbook.save(self._file)
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._owned:
+            self._file.close()
+
+
+# Latest record of every field (location) in the history, read chunk by chunk so
+# memory is bounded by the number of fields rather than the history length
+def latest_fields(chunks):
+    latest = {}
+    for chunk in chunks:
+        chunk = chunk.reindex(columns=FIELD_COLUMNS).dropna(subset=["location"])
+        chunk = chunk.drop_duplicates("location", keep="last")
+        latest.update(zip(chunk["location"], chunk.itertuples(index=False, name=None)))
+    return pd.DataFrame(list(latest.values()), columns=FIELD_COLUMNS)
+
+
+def select_fields(fields, location=None, crops=None, soil_types=None, seasons=None):
+    mask = pd.Series(True, index=fields.index)
+    if location:
+        mask &= fields["location"].astype(str).str.contains(location, case=False, regex=False)
+    for column, allowed in (("crop", crops), ("soil_type", soil_types), ("season", seasons)):
+        if allowed:
+            mask &= fields[column].isin(allowed)
+    return fields[mask].reset_index(drop=True)
+
+
+def plan_rows(location, soil_type, season, crop, plans, date):
+    rows = []
+    for rank, plan in enumerate(plans, start=1):
+        for step, (next_season, next_crop) in enumerate(plan.steps):
+            rows.append((location, soil_type, season, crop, rank, round(plan.score, 3),
+                         step // len(SEASON_CYCLE) + 1, next_season, next_crop, date))
+    return rows
@@ -0,0 +1,246 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+
+RANKING_METHODS = ("mean", "beta", "thompson")
+CONTEXT_COLUMNS = ["climate", "soil_type", "season"]
+CHECKPOINT_BYTES = 1 << 20
+
+
+def _key(crop, suggestion, context=None):
+    return "|".join([crop, suggestion, *(context or ())])
+
+
+def _lines(events):
+    return "".join(json.dumps(event) + "\n" for event in events).encode()
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+# Running success/trial counters per (crop, suggestion), optionally split by
+# (climate, soil_type, season). Updates are O(1) and ranking reads only the
+# counters, never the raw feedback log. With a half-life set, older ratings are
+# decayed exponentially whenever a counter is touched.
+#
+# With a path, each batch of ratings is one append to a journal next to it
+# (`<path>.log`) and the counters are that journal folded in order, so every
+# process sharing the path sees every rating: reads fold in whatever was
+# appended since they last looked (just a stat when nothing was). The file at
+# `path` is a snapshot of the counters and the journal offset they cover,
+# rewritten every CHECKPOINT_BYTES of journal so a restart replays little.
+class FeedbackModel:
+    def __init__(self, path=None, half_life_days=None, method="mean"):
+        if method not in RANKING_METHODS:
+            raise ValueError(f"Unknown ranking method: {method}")
+        self.path = path
+        self.journal_path = f"{path}.log" if path else None
+        self.half_life = half_life_days * 86400 if half_life_days else None
+        self.method = method
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._by_crop = {}
+        self._offset = 0  # journal bytes folded into the counters
+        self._saved_offset = 0
+        self._inode = None
+        self.version = 0  # bumped on every change so derived caches can tell they are stale
+
+    def _decayed(self, entry, now):
+        successes, trials, updated = entry
+        if self.half_life and now > updated:
+            factor = math.pow(0.5, (now - updated) / self.half_life)
+            successes, trials = successes * factor, trials * factor
+        return successes, trials
+
+    def _bump(self, key, crop, suggestion, context, rating, now):
+        entry = self._counts.get(key)
+        successes, trials = self._decayed(entry, now) if entry else (0.0, 0.0)
+        self._counts[key] = [successes + rating, trials + 1, now]
+        self.version += 1
+        self._by_crop.setdefault((crop, context), set()).add(suggestion)
+
+    def _apply(self, crop, suggestion, rating, climate, soil_type, season, now):
+        self._bump(_key(crop, suggestion), crop, suggestion, None, rating, now)
+        if climate and soil_type and season:
+            context = (climate, soil_type, season)
+            self._bump(_key(crop, suggestion, context), crop, suggestion, context, rating, now)
+
+    def _reset(self, counts=None):
+        self._counts = counts or {}
+        self._by_crop = {}
+        self.version += 1
+        for key in self._counts:
+            crop, suggestion, *context = key.split("|")
+            self._by_crop.setdefault((crop, tuple(context) or None), set()).add(suggestion)
+
+    def record(self, crop, suggestion, rating, climate=None, soil_type=None, season=None, ts=None):
+        self.record_many([(crop, suggestion, rating, climate, soil_type, season)], ts)
+
+    # Rows are (crop, suggestion, rating, climate, soil_type, season)
+    def record_many(self, rows, ts=None):
+        now = ts if ts is not None else time.time()
+        events = [[crop, suggestion, float(rating), climate, soil_type, season, now]
+                  for crop, suggestion, rating, climate, soil_type, season in rows]
+        if not self.path:
+            with self._lock:
+                for event in events:
+                    self._apply(*event)
+            return
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, _lines(events))
+        finally:
+            os.close(fd)
+        self.sync()
+
+    # Folds in the journal lines any process appended since the last sync. A
+    # journal replaced by a rebuild means reloading from its snapshot.
+    def sync(self):
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._inode and stat.st_size == self._offset:
+            return
+        with self._lock, open(self.journal_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            replaced = self._inode is not None and (stat.st_ino != self._inode or stat.st_size < self._offset)
+            if not replaced:
+                if stat.st_size < self._offset:
+                    self._offset = self._saved_offset = 0  # journal started over after the snapshot
+                self._inode = stat.st_ino
+                f.seek(self._offset)
+                data = f.read()
+                end = data.rfind(b"\n") + 1  # a line still being written waits for the next sync
+                for line in data[:end].splitlines():
+                    self._apply(*json.loads(line))
+                self._offset += end
+            checkpoint = self._offset - self._saved_offset >= CHECKPOINT_BYTES
+        if replaced:
+            self.load()
+        elif checkpoint:
+            self.save()
+
+    def counts(self, crop, suggestion, context=None, now=None):
+        entry = self._counts.get(_key(crop, suggestion, context))
+        if entry is None:
+            return 0.0, 0.0
+        return self._decayed(entry, now if now is not None else time.time())
+
+    def _score(self, successes, trials):
+        if self.method == "beta":
+            return (successes + 1) / (trials + 2)
+        if self.method == "thompson":
+            return random.betavariate(successes + 1, trials - successes + 1)
+        return successes / trials if trials else 0.0
+
+    def scores(self, crop, context=None):
+        self.sync()
+        now = time.time()
+        with self._lock:
+            suggestions = self._by_crop.get((crop, context), ())
+            return {s: self._score(*self.counts(crop, s, context, now)) for s in suggestions}
+
+    # Scores used to rank suggestions for a crop, falling back from the context
+    # split to the global counters; an empty dict means "keep rule order"
+    def ranking_scores(self, crop, context=None):
+        scores = self.scores(crop, context)
+        if context is not None and not scores:
+            scores = self.scores(crop)
+        return scores, self._score(0.0, 0.0)
+
+    def rank(self, crop, options, context=None):
+        scores, default = self.ranking_scores(crop, context)
+        if not scores:
+            return list(options)
+        return sorted(options, key=lambda x: scores.get(x, default), reverse=True)
+
+    # Counters from the raw feedback log, written out as a new journal. With
+    # replace=False an existing journal wins: another process built it first.
+    def rebuild(self, feedback_df, replace=True):
+        now = time.time()
+        has_context = all(c in feedback_df.columns for c in CONTEXT_COLUMNS)
+        events = []
+        for row in feedback_df.to_dict("records"):
+            if row.get("rating") is None or row["rating"] != row["rating"]:
+                continue
+            context = [row[c] if has_context and isinstance(row[c], str) else None for c in CONTEXT_COLUMNS]
+            events.append([row["crop"], row["suggestion"], float(row["rating"]), *context, now])
+        with self._lock:
+            self._reset()
+            for event in events:
+                self._apply(*event)
+            self._offset = self._saved_offset = 0
+            self._inode = None
+        if not self.path:
+            return
+        data = _lines(events)
+        tmp = _tmp_path(self.journal_path)
+        with open(tmp, "wb") as f:
+            f.write(data)
+            inode = os.fstat(f.fileno()).st_ino
+        try:
+            if replace:
+                os.replace(tmp, self.journal_path)
+            else:
+                os.link(tmp, self.journal_path)
+        except FileExistsError:
+            self.load()
+            return
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._offset, self._inode = len(data), inode
+        self.save()
+        self.sync()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = {"half_life": self.half_life, "counts": self._counts, "journal_offset": self._offset}
+            self._saved_offset = self._offset
+            tmp = _tmp_path(self.path)
+            with open(tmp, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.path)
+
+    # False when there is neither a snapshot nor a journal to load
+    def load(self):
+        if not self.path:
+            return False
+        snapshot = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        elif not os.path.exists(self.journal_path):
+            return False
+        with self._lock:
+            self._reset(snapshot["counts"] if snapshot else None)
+            self._offset = self._saved_offset = snapshot.get("journal_offset", 0) if snapshot else 0
+            self._inode = None
+        self.sync()
+        return True
+
+
+# Rebuild the persisted aggregate from the raw feedback log:
+#   python -m crop_rotation.feedback --feedback feedback.csv --model feedback_model.json
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Rebuild the feedback ranking model from the raw feedback file")
+    parser.add_argument("--feedback", default="feedback.csv")
+    parser.add_argument("--model", default=os.getenv("FEEDBACK_MODEL", "feedback_model.json"))
+    parser.add_argument("--half-life-days", type=float, default=None)
+    args = parser.parse_args()
+    model = FeedbackModel(args.model, args.half_life_days)
+    model.rebuild(pd.read_csv(args.feedback))
+    print(f"Rebuilt {len(model._counts)} counters into {args.model}")
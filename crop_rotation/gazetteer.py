@@ -0,0 +1,317 @@
+import argparse
+import csv
+import difflib
+import gzip
+import math
+import os
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from .climate import ClimateReading
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+GAZETTEER_PATH = os.path.join(DATA_DIR, "gazetteer.csv.gz")
+NORMALS_PATH = os.path.join(DATA_DIR, "climate_normals.npz")
+GAZETTEER_COLUMNS = ["name", "country", "lat", "lon", "population", "aliases"]
+MAX_ALIASES = 4
+FUZZY_CUTOFF = 0.8
+FUZZY_MIN_LENGTH = 5  # "farm", "main", "test" are too close to too many places
+FUZZY_MARGIN = 0.05  # spellings this close to the best count as ties...
+FUZZY_POPULATION_RATIO = 10  # ...won only by a place this many times more populous
+FUZZY_SHORT_LENGTH = 8  # names shorter than this ("river", "garden")
+FUZZY_SHORT_MIN_POPULATION = 500_000  # are only guessed as large cities
+MAX_DISTANCE_KM = 250  # further than this from any land cell counts as unknown
+EARTH_RADIUS_KM = 6371.0
+LEAF_SIZE = 8
+
+# match is "exact", "alias" or "fuzzy"
+Place = namedtuple("Place", ["name", "country", "lat", "lon", "population", "match"])
+
+
+# "São Paulo", "sao-paulo" and "SAO PAULO " all become "sao paulo"
+def normalise_name(name):
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+# City name -> coordinates from a bundled GeoNames extract. Exact and alias
+# lookups are a dict probe (most populous place wins, "Name, CC" picks the
+# country); anything else is matched fuzzily against names with the same first
+# letter and a similar length. Results are memoised per query string.
+class Gazetteer:
+    def __init__(self, path=GAZETTEER_PATH, fuzzy_cutoff=FUZZY_CUTOFF):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.places = []
+        self._names = {}
+        self._aliases = {}
+        self._buckets = defaultdict(list)
+        opener = gzip.open if path.endswith(".gz") else open
+        aliases = []
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self.places.append((row["name"], row["country"], float(row["lat"]), float(row["lon"]),
+                                    int(row["population"] or 0)))
+                aliases.append(row["aliases"])
+        # Most populous first, so the first place under a key is the default
+        by_population = sorted(range(len(self.places)), key=lambda i: -self.places[i][4])
+        for i in by_population:
+            self._names.setdefault(normalise_name(self.places[i][0]), []).append(i)
+        for i in by_population:
+            for alias in filter(None, aliases[i].split("|")):
+                key = normalise_name(alias)
+                if key not in self._names:
+                    self._aliases.setdefault(key, []).append(i)
+        for key in list(self._names) + list(self._aliases):
+            if key:
+                self._buckets[key[0], len(key)].append(key)
+        self.locate = lru_cache(maxsize=8192)(self._locate)
+
+    def __len__(self):
+        return len(self.places)
+
+    def _choose(self, indices, country):
+        if country:
+            indices = [i for i in indices if self.places[i][1] == country] or indices
+        return indices[0]
+
+    def _pick(self, indices, country, match):
+        return Place(*self.places[self._choose(indices, country)], match)
+
+    def _locate(self, name):
+        key = normalise_name(name)
+        country = None
+        if "," in str(name):
+            city, _, hint = str(name).rpartition(",")
+            hint = hint.strip().upper()
+            if len(hint) == 2 and hint.isalpha():
+                key, country = normalise_name(city), hint
+        if not key:
+            return None
+        if key in self._names:
+            return self._pick(self._names[key], country, "exact")
+        if key in self._aliases:
+            return self._pick(self._aliases[key], country, "alias")
+        if len(key) < FUZZY_MIN_LENGTH:
+            return None
+        candidates = [k for n in range(len(key) - 2, len(key) + 3) for k in self._buckets.get((key[0], n), ())]
+        close = difflib.get_close_matches(key, candidates, n=5, cutoff=self.fuzzy_cutoff)
+        if not close:
+            return None
+        matcher = difflib.SequenceMatcher(b=key)
+        best_ratio = {}
+        for candidate in close:
+            matcher.set_seq1(candidate)
+            i = self._choose(self._names.get(candidate) or self._aliases[candidate], country)
+            best_ratio[i] = max(best_ratio.get(i, 0.0), matcher.ratio())
+        # Near-equal spellings go to the most populous place, but only when it
+        # clearly dominates; otherwise the guess is left to the weather API
+        top = max(best_ratio.values())
+        near = [i for i, ratio in best_ratio.items() if ratio >= top - FUZZY_MARGIN]
+        best = max(near, key=lambda i: self.places[i][4])
+        population = self.places[best][4]
+        if any(i != best and self.places[i][4] * FUZZY_POPULATION_RATIO > population for i in near):
+            return None
+        if len(key) < FUZZY_SHORT_LENGTH and population < FUZZY_SHORT_MIN_POPULATION:
+            return None
+        return Place(*self.places[best], "fuzzy")
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+# Static k-d tree over 3-d unit vectors (so longitude wraps around the
+# antimeridian). Nodes are implicit: each range of the permutation splits at
+# its median on the widest axis, and ranges of LEAF_SIZE or fewer are scanned.
+class KDTree:
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        self._order = np.arange(len(points))
+        self._axes = np.zeros(len(points), dtype=np.int8)
+        stack = [(0, len(points))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            idx = self._order[lo:hi]
+            axis = int(np.argmax(np.ptp(points[idx], axis=0)))
+            mid = (lo + hi) // 2
+            self._order[lo:hi] = idx[np.argpartition(points[idx, axis], mid - lo)]
+            self._axes[mid] = axis
+            stack += [(lo, mid), (mid + 1, hi)]
+        self._points = points[self._order].tolist()
+        self._axes = self._axes.tolist()
+
+    def __len__(self):
+        return len(self._points)
+
+    # Index (into the original points) of the nearest point within
+    # sqrt(max_distance2) and its squared distance, or (None, inf)
+    def query(self, point, max_distance2=math.inf):
+        best = [max_distance2, -1]
+        self._search(0, len(self._points), point, best)
+        if best[1] < 0:
+            return None, math.inf
+        return int(self._order[best[1]]), best[0]
+
+    def _search(self, lo, hi, q, best):
+        points = self._points
+        if hi - lo <= LEAF_SIZE:
+            for i in range(lo, hi):
+                p = points[i]
+                d = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+                if d < best[0]:
+                    best[0], best[1] = d, i
+            return
+        mid = (lo + hi) // 2
+        p = points[mid]
+        d = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+        if d < best[0]:
+            best[0], best[1] = d, mid
+        diff = q[self._axes[mid]] - p[self._axes[mid]]
+        near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+        self._search(*near, q, best)
+        if diff * diff < best[0]:
+            self._search(*far, q, best)
+
+
+# Köppen-Geiger climate class of the nearest land cell in a gridded normals
+# file; arid and semi-arid (B*) classes are "dry", everything else "humid".
+class ClimateNormals:
+    def __init__(self, path=NORMALS_PATH, max_distance_km=MAX_DISTANCE_KM):
+        with np.load(path) as data:
+            self.lat = data["lat"]
+            self.lon = data["lon"]
+            self.zone = data["zone"]
+            self.zones = data["zones"].tolist()
+        self._dry = np.array([name.startswith("B") for name in self.zones])[self.zone].tolist()
+        self._tree = KDTree(_unit_vectors(self.lat, self.lon))
+        # Chord length of the great-circle distance
+        self._max_chord2 = (2 * math.sin(max_distance_km / EARTH_RADIUS_KM / 2)) ** 2
+
+    def __len__(self):
+        return len(self._tree)
+
+    def cell(self, lat, lon):
+        return self._tree.query(_unit_vector(lat, lon), self._max_chord2)[0]
+
+    def koppen(self, lat, lon):
+        i = self.cell(lat, lon)
+        return self.zones[self.zone[i]] if i is not None else None
+
+    def classify(self, lat, lon):
+        i = self.cell(lat, lon)
+        if i is None:
+            return None
+        return "dry" if self._dry[i] else "humid"
+
+
+# Offline stand-in for the weather API: coordinates from the gazetteer and the
+# humid/dry class from the normals. Returns None when either has no answer.
+class OfflineClimate:
+    def __init__(self, gazetteer, normals):
+        self.gazetteer = gazetteer
+        self.normals = normals
+        self.lookup = lru_cache(maxsize=8192)(self._lookup)
+
+    @classmethod
+    def load(cls, gazetteer_path=GAZETTEER_PATH, normals_path=NORMALS_PATH):
+        gazetteer = Gazetteer(gazetteer_path) if gazetteer_path and os.path.exists(gazetteer_path) else None
+        normals = ClimateNormals(normals_path) if normals_path and os.path.exists(normals_path) else None
+        return cls(gazetteer, normals)
+
+    def _lookup(self, city):
+        if self.gazetteer is None or self.normals is None:
+            return None
+        place = self.gazetteer.locate(city)
+        if place is None:
+            return None
+        climate = self.normals.classify(place.lat, place.lon)
+        if climate is None:
+            return None
+        return ClimateReading(climate, place.lat, place.lon, None, None, "offline", None,
+                              f"{place.name}, {place.country}", place.match)
+
+
+# GeoNames dump (e.g. cities15000.txt) -> bundled gazetteer
+def build_gazetteer(source, output=GAZETTEER_PATH, min_population=0):
+    count = 0
+    with open(source, encoding="utf-8", newline="") as src, \
+            gzip.open(output, "wt", encoding="utf-8", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(GAZETTEER_COLUMNS)
+        for row in csv.reader(src, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) < 15 or int(row[14] or 0) < min_population:
+                continue
+            name, ascii_name, alternates = row[1], row[2], row[3].split(",")
+            seen = {normalise_name(name)}
+            aliases = []
+            for alias in [ascii_name] + alternates:
+                key = normalise_name(alias)
+                # Latin-script spellings only; the rest normalise to nothing useful
+                if key and key not in seen and alias.isascii() and len(aliases) < MAX_ALIASES:
+                    seen.add(key)
+                    aliases.append(alias)
+            writer.writerow([name, row[8], row[4], row[5], row[14] or 0, "|".join(aliases)])
+            count += 1
+    return count
+
+
+# CSV of land cells (lat, lon, koppen) -> bundled normals grid
+def build_normals(source, output=NORMALS_PATH):
+    lat, lon, names = [], [], []
+    with open(source, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            lat.append(float(row["lat"]))
+            lon.append(float(row["lon"]))
+            names.append(row["koppen"])
+    zones = sorted(set(names))
+    codes = {name: i for i, name in enumerate(zones)}
+    np.savez_compressed(
+        output, lat=np.array(lat, dtype=np.float32), lon=np.array(lon, dtype=np.float32),
+        zone=np.array([codes[name] for name in names], dtype=np.uint8), zones=np.array(zones),
+    )
+    return len(lat)
+
+
+#   python -m crop_rotation.gazetteer lookup "Pune, IN"
+#   python -m crop_rotation.gazetteer cities cities15000.txt
+#   python -m crop_rotation.gazetteer normals koppen_cells.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline gazetteer and climate normals")
+    commands = parser.add_subparsers(dest="command", required=True)
+    lookup = commands.add_parser("lookup", help="resolve place names offline")
+    lookup.add_argument("names", nargs="+")
+    cities = commands.add_parser("cities", help="build the gazetteer from a GeoNames cities dump")
+    cities.add_argument("source")
+    cities.add_argument("-o", "--output", default=GAZETTEER_PATH)
+    cities.add_argument("--min-population", type=int, default=0)
+    normals = commands.add_parser("normals", help="build the normals grid from a lat,lon,koppen CSV")
+    normals.add_argument("source")
+    normals.add_argument("-o", "--output", default=NORMALS_PATH)
+    args = parser.parse_args()
+
+    if args.command == "cities":
+        print(f"Wrote {build_gazetteer(args.source, args.output, args.min_population)} places to {args.output}")
+    elif args.command == "normals":
+        print(f"Wrote {build_normals(args.source, args.output)} land cells to {args.output}")
+    else:
+        offline = OfflineClimate.load()
+        for name in args.names:
+            place = offline.gazetteer.locate(name) if offline.gazetteer else None
+            reading = offline.lookup(name)
+            if place is None:
+                print(f"{name}: not found")
+            else:
+                print(f"{name}: {place.name}, {place.country} ({place.lat:.4f}, {place.lon:.4f}) "
+                      f"[{place.match}] -> {reading.climate if reading else 'unknown'}")
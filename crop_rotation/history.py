@@ -0,0 +1,202 @@
+import csv
+import io
+import os
+import threading
+import warnings
+from array import array
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+HISTORY_COLUMNS = ["date", "crop", "location", "soil_type", "season"]
+RECENT_WINDOW = 2
+READ_BLOCK = 1 << 20
+FILTER_COLUMNS = ["crop", "location", "soil_type", "season"]
+PAGE_SIZE = 50
+BULK_PARSE_ROWS = 1000
+
+
+def empty_rollups():
+    return {"total": 0, "crop": Counter(), "location": Counter(), "season_soil": Counter(), "month": Counter()}
+
+
+# Per-location index of the most recent crops in the history CSV. The file is
+# parsed once; afterwards only bytes appended since the last read are consumed,
+# so a lookup costs a stat() plus a small deque copy. The same pass keeps the
+# rollups (counts by crop, location, season/soil and month) and, per row, its
+# byte offset plus small integer codes of the filter columns, so one page of a
+# filtered history view is found with NumPy and read back with a few seeks.
+class HistoryStore:
+    def __init__(self, path, window=RECENT_WINDOW):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._recent = defaultdict(lambda: deque(maxlen=self.window))
+        self._offset = 0
+        self._inode = None
+        self._columns = None
+        self._header = None
+        self._rollups = empty_rollups()
+        self._row_offsets = array("q")
+        self._codes = {column: {} for column in FILTER_COLUMNS}
+        self._row_codes = {column: array("I") for column in FILTER_COLUMNS}
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def refresh(self):
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._clear()
+                return
+            # A rewrite (e.g. "Reset Crop History") shows up as a new inode or a shrink
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._clear()
+                self._inode = stat.st_ino
+            if stat.st_size > self._offset:
+                self._tail()
+
+    def _tail(self):
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            pending = b""
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    break
+                pending += block
+                cut = pending.rfind(b"\n")
+                if cut < 0:
+                    continue
+                complete, pending = pending[:cut + 1], pending[cut + 1:]
+                self._ingest(complete, self._offset)
+                self._offset += len(complete)
+            # A trailing partial line is left for the next refresh
+
+    def _ingest(self, data, offset):
+        if self._columns is None:
+            cut = data.find(b"\n") + 1
+            header = next(csv.reader([data[:cut].decode("utf-8")]), None)
+            if header is None:
+                return
+            self._header = header
+            self._columns = {name: i for i, name in enumerate(header)}
+            data, offset = data[cut:], offset + cut
+        if data:
+            self._add_rows(*self._parse(data, offset))
+
+    # pandas' C parser handles large well-formed blocks; small appends and
+    # anything else (blank, short, over-long or quoted multi-line rows) go
+    # through the csv module row by row
+    def _parse(self, data, offset):
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+        starts = offset + np.concatenate(([0], newlines[:-1] + 1))
+        frame = None
+        if len(starts) >= BULK_PARSE_ROWS:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", pd.errors.ParserWarning)  # extra fields are dropped, as below
+                try:
+                    frame = pd.read_csv(io.BytesIO(data), header=None, names=self._header, index_col=False,
+                                        dtype=object, keep_default_na=False, skip_blank_lines=False)
+                except (ValueError, pd.errors.ParserError):
+                    pass
+        if frame is not None and len(frame) == len(starts) and all(
+            (frame[name] != "").all() for name in ("crop", "location") if name in frame
+        ):
+            return starts, {name: frame[name].to_numpy() if name in frame else np.full(len(frame), "", dtype=object)
+                            for name in HISTORY_COLUMNS}
+        index = {name: self._columns.get(name, HISTORY_COLUMNS.index(name)) for name in HISTORY_COLUMNS}
+        width = max(index["crop"], index["location"])
+        lines = data.split(b"\n")[:-1]
+        valid = [(start, row) for start, row in zip(starts, csv.reader(line.decode("utf-8") for line in lines))
+                 if len(row) > width]
+        columns = {name: np.array([row[i] if i < len(row) else "" for _, row in valid], dtype=object)
+                   for name, i in index.items()}
+        return np.array([start for start, _ in valid], dtype=np.int64), columns
+
+    def _add_rows(self, starts, columns):
+        if not len(starts):
+            return
+        local = {}
+        for column in FILTER_COLUMNS:
+            row_codes, uniques = pd.factorize(columns[column])
+            local[column] = row_codes, uniques
+            codes = self._codes[column]
+            to_global = np.array([codes.setdefault(value, len(codes)) for value in uniques], dtype=np.uint32)
+            self._row_codes[column].frombytes(to_global[row_codes].tobytes())
+        self._row_offsets.frombytes(starts.astype(np.int64).tobytes())
+
+        rollups = self._rollups
+        rollups["total"] += len(starts)
+        for column in ("crop", "location"):
+            row_codes, uniques = local[column]
+            rollups[column].update(dict(zip(uniques, np.bincount(row_codes, minlength=len(uniques)).tolist())))
+        (season_codes, seasons), (soil_codes, soils) = local["season"], local["soil_type"]
+        pairs = np.bincount(season_codes * len(soils) + soil_codes, minlength=len(seasons) * len(soils))
+        rollups["season_soil"].update({(seasons[i // len(soils)], soils[i % len(soils)]): int(n)
+                                       for i, n in enumerate(pairs) if n})
+        date_codes, dates = pd.factorize(columns["date"])
+        for date, n in zip(dates, np.bincount(date_codes, minlength=len(dates)).tolist()):
+            rollups["month"][str(date)[:7]] += n
+
+        # Only the last `window` rows per location can still be in the recent-crop index
+        location_codes, locations = local["location"]
+        order = np.argsort(location_codes, kind="stable")
+        group_end = np.cumsum(np.bincount(location_codes, minlength=len(locations)))[location_codes[order]]
+        tail = np.sort(order[group_end - np.arange(len(order)) <= self.window])
+        crops = columns["crop"]
+        for i in tail.tolist():
+            self._recent[locations[location_codes[i]]].append(crops[i])
+
+    def recent_crops(self, location):
+        self.refresh()
+        with self._lock:
+            recent = self._recent.get(location)
+            return list(recent) if recent else []
+
+    def locations(self):
+        self.refresh()
+        with self._lock:
+            return list(self._recent)
+
+    def rollups(self):
+        self.refresh()
+        with self._lock:
+            return {key: value.copy() if isinstance(value, Counter) else value for key, value in self._rollups.items()}
+
+    # Newest rows first; filters are exact matches on FILTER_COLUMNS
+    def page(self, page=0, page_size=PAGE_SIZE, **filters):
+        self.refresh()
+        with self._lock:
+            matches = None
+            for column in FILTER_COLUMNS:
+                value = filters.get(column)
+                if value is None:
+                    continue
+                code = self._codes[column].get(value)
+                mask = np.frombuffer(self._row_codes[column], dtype=np.uint32) == code if code is not None \
+                    else np.zeros(len(self._row_offsets), dtype=bool)
+                matches = mask if matches is None else matches & mask
+            rows = np.flatnonzero(matches) if matches is not None else None
+            total = len(rows) if rows is not None else len(self._row_offsets)
+            end = max(total - page * page_size, 0)
+            selected = range(max(end - page_size, 0), end)
+            offsets = [self._row_offsets[rows[i] if rows is not None else i] for i in reversed(selected)]
+            header = self._header
+        return self._read_rows(offsets, header), total
+
+    def _read_rows(self, offsets, header):
+        lines = []
+        if offsets:
+            with open(self.path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    lines.append(f.readline().decode("utf-8"))
+        return [dict(zip(header, row)) for row in csv.reader(lines)]
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_RERUNS = 50
+
+logger = logging.getLogger("crop_rotation.metrics")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.total += seconds
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+
+
+# Process-wide span and rerun histograms. Streamlit runs each session's script
+# on its own thread, so the spans of the rerun in progress are thread-local.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._reruns = {}
+        self._local = threading.local()
+        self.recent = deque(maxlen=RECENT_RERUNS)
+        self.log_path = None
+        self.log_max_bytes = None
+        self.prom_path = None
+        self._log_lock = threading.Lock()
+        self._prom_thread = None
+
+    # The rerun log is appended per rerun and rotated to <log_path>.1 once it
+    # passes log_max_bytes; the Prometheus file is rewritten every prom_interval
+    # seconds by a background thread rather than on every rerun.
+    def configure(self, log_path=None, prom_path=None, log_max_bytes=None, prom_interval=15):
+        self.log_path = log_path or None
+        self.log_max_bytes = log_max_bytes or None
+        self.prom_path = prom_path or None
+        if self.prom_path and self._prom_thread is None:
+            self._prom_thread = threading.Thread(target=self._write_prom_every, args=(prom_interval,),
+                                                 name="metrics-prom", daemon=True)
+            self._prom_thread.start()
+
+    def start_rerun(self):
+        self._local.started = time.perf_counter()
+        self._local.spans = []
+
+    def record(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._spans.setdefault(key, Histogram()).observe(seconds)
+        spans = getattr(self._local, "spans", None)
+        if spans is not None:
+            spans.append({"span": name, **labels, "ms": round(seconds * 1000, 3)})
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.record(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def end_rerun(self, page):
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return None
+        seconds = time.perf_counter() - started
+        entry = {"ts": time.time(), "page": page, "total_ms": round(seconds * 1000, 3), "spans": self._local.spans}
+        self._local.started = None
+        self._local.spans = None
+        with self._lock:
+            self._reruns.setdefault(page, Histogram()).observe(seconds)
+            self.recent.append(entry)
+        self._export(entry)
+        return entry
+
+    def _export(self, entry):
+        line = json.dumps(entry)
+        logger.info(line)
+        if not self.log_path:
+            return
+        try:
+            with self._log_lock:
+                with open(self.log_path, "a") as f:
+                    f.write(line + "\n")
+                    size = f.tell()
+                if self.log_max_bytes and size > self.log_max_bytes:
+                    os.replace(self.log_path, f"{self.log_path}.1")
+        except OSError as exc:
+            logger.warning("Could not export metrics: %s", exc)
+
+    def write_prom(self):
+        if not self.prom_path:
+            return
+        try:
+            tmp = f"{self.prom_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp, self.prom_path)
+        except OSError as exc:
+            logger.warning("Could not export metrics: %s", exc)
+
+    def _write_prom_every(self, interval):
+        while True:
+            time.sleep(interval)
+            self.write_prom()
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for metric, help_text, series, label in (
+                ("crop_rotation_span_seconds", "Time spent in instrumented sections", self._spans, None),
+                ("crop_rotation_rerun_seconds", "Total script rerun time per page", self._reruns, "page"),
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key, hist in sorted(series.items()):
+                    labels = (("span", key[0]),) + key[1] if label is None else ((label, key),)
+                    base = _labels(labels)
+                    for bound, count in zip(BUCKETS, hist.counts):
+                        lines.append(f'{metric}_bucket{{{base},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{base},le="+Inf"}} {hist.count}')
+                    lines.append(f"{metric}_sum{{{base}}} {hist.total}")
+                    lines.append(f"{metric}_count{{{base}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+METRICS = Metrics()
+span = METRICS.span
+timed = METRICS.timed
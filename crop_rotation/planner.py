@@ -0,0 +1,90 @@
+from collections import namedtuple
+
+from .rules import ROTATION_RULES, compile_rules, rotation_options
+
+SEASON_CYCLE = ["Monsoon", "Winter", "Summer"]
+FALLOW = "Fallow"
+MAX_MEMO = 200_000
+
+# steps is a tuple of (season, crop) pairs; score is the cumulative feedback score
+Plan = namedtuple("Plan", ["score", "steps"])
+
+
+def seasons_for(years):
+    return len(SEASON_CYCLE) * years
+
+
+# Multi-season rotation search. Each season the next crop must satisfy the same
+# rules as suggest_rotation (season options, avoid list, last two crops). A
+# season with no valid option is left fallow; a crop without rules of its own
+# ends the plan. The top_k best sub-plans are memoised per
+# (crop, climate, soil, season, recent-crop window, seasons left), so plans
+# share work across branches, horizons and calls until feedback or the rules
+# change (rules may be a RuleCatalog that reloads its file).
+class RotationPlanner:
+    def __init__(self, rules=ROTATION_RULES, feedback_model=None, by_context=False, top_k=3):
+        self.rules = rules
+        self._table = None
+        self.feedback_model = feedback_model
+        self.by_context = by_context
+        self.top_k = top_k
+        self._memo = {}
+        self._scores = {}
+        self._version = None
+
+    def _sync(self):
+        version = None
+        if self.feedback_model is not None:
+            self.feedback_model.sync()
+            version = self.feedback_model.version
+        table = compile_rules(self.rules)
+        if version != self._version or table is not self._table or len(self._memo) > MAX_MEMO:
+            self._memo.clear()
+            self._scores.clear()
+            self._version = version
+            self._table = table
+
+    def _gain(self, crop, climate, soil_type, season, option):
+        if self.feedback_model is None:
+            return 0.0
+        context = (climate, soil_type, season) if self.by_context else None
+        key = (crop, context)
+        if key not in self._scores:
+            self._scores[key] = self.feedback_model.ranking_scores(crop, context)
+        scores, default = self._scores[key]
+        return scores.get(option, default) if scores else 0.0
+
+    def _best(self, crop, climate, soil_type, season_idx, window, remaining):
+        if remaining == 0 or crop not in self._table:
+            return [Plan(0.0, ())]
+        key = (crop, climate, soil_type, season_idx, window, remaining)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        season = SEASON_CYCLE[season_idx]
+        next_idx = (season_idx + 1) % len(SEASON_CYCLE)
+        options = rotation_options(crop, climate, soil_type, season, list(window), rules=self._table)
+        candidates = []
+        if isinstance(options, list):
+            for option in options:
+                gain = self._gain(crop, climate, soil_type, season, option)
+                next_window = (crop, option)  # once planted, the last two crops are these
+                for sub in self._best(option, climate, soil_type, next_idx, next_window, remaining - 1):
+                    candidates.append(Plan(gain + sub.score, ((season, option),) + sub.steps))
+        else:
+            for sub in self._best(crop, climate, soil_type, next_idx, window, remaining - 1):
+                candidates.append(Plan(sub.score, ((season, FALLOW),) + sub.steps))
+        # Stable sort: equal scores keep the rule's option order
+        candidates.sort(key=lambda plan: -plan.score)
+        result = self._memo[key] = candidates[:self.top_k]
+        return result
+
+    # No plans for a season outside SEASON_CYCLE (a catalog may define others)
+    def plan(self, crop, climate, soil_type, season, past_crops=(), years=3):
+        if season not in SEASON_CYCLE:
+            return []
+        self._sync()
+        season_idx = SEASON_CYCLE.index(season)
+        window = tuple(past_crops)[-2:]
+        return [plan for plan in self._best(crop, climate, soil_type, season_idx, window, seasons_for(years)) if plan.steps]
@@ -0,0 +1,366 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+MAX_LISTED_CROPS = 10  # named in the unsupported-crop message
+NO_OPTIONS = "No suitable rotation options for this season. Try another crop or season."
+CLIMATES = ["humid", "dry"]
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rotation_rules.json")
+FALLBACK_SOIL = "Loamy"
+RELOAD_INTERVAL = 1.0  # seconds between checks of the catalog file
+NO_MASK = ((), 0, ())
+
+logger = logging.getLogger("crop_rotation.rules")
+
+
+# "Crop not supported. Try Wheat, Rice, Maize, Legumes, or Millets." for the
+# bundled catalog; large catalogs name the first few crops and count the rest
+def unsupported_message(crops):
+    if not crops:
+        return "Crop not supported. The rule catalog has no crops."
+    named = list(crops[:MAX_LISTED_CROPS])
+    if len(crops) > len(named):
+        named.append(f"one of {len(crops) - len(named)} other crops")
+    if len(named) <= 2:
+        return f"Crop not supported. Try {' or '.join(named)}."
+    return f"Crop not supported. Try {', '.join(named[:-1])}, or {named[-1]}."
+
+
+# A catalog is JSON (or YAML, which needs PyYAML) of the form
+#   {"crops": {crop: {"humid": {soil: {season: [options]}}, "dry": {...}, "avoid": [crops]}},
+#    "regions": {region: {crop: partial crop rules}}}
+# A region's entries are merged over the base crops key by key (lists replace).
+def read_catalog(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _merge(base, overlay):
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def _is_names(value):
+    return isinstance(value, list) and all(isinstance(name, str) and name for name in value)
+
+
+def validate_rules(rules):
+    errors = []
+    if not isinstance(rules, dict) or not rules:
+        return ["catalog has no crops"]
+    for crop, entry in rules.items():
+        if not isinstance(entry, dict):
+            errors.append(f"{crop}: expected a mapping")
+            continue
+        if not _is_names(entry.get("avoid")):
+            errors.append(f"{crop}: 'avoid' must be a list of crop names")
+        for climate in CLIMATES:
+            by_soil = entry.get(climate)
+            if not isinstance(by_soil, dict) or FALLBACK_SOIL not in by_soil:
+                errors.append(f"{crop}: '{climate}' needs soil rules including '{FALLBACK_SOIL}'")
+                continue
+            for soil, by_season in by_soil.items():
+                if not isinstance(by_season, dict):
+                    errors.append(f"{crop}/{climate}/{soil}: expected a season mapping")
+                    continue
+                for season, options in by_season.items():
+                    if not _is_names(options):
+                        errors.append(f"{crop}/{climate}/{soil}/{season}: expected a list of crop names")
+        unknown = set(entry) - set(CLIMATES) - {"avoid"}
+        if unknown:
+            errors.append(f"{crop}: unknown keys {sorted(unknown)}")
+    return errors
+
+
+def load_catalog(path=RULES_PATH, region=None):
+    catalog = read_catalog(path)
+    if not isinstance(catalog, dict) or not isinstance(catalog.get("crops"), dict):
+        raise ValueError(f"{path}: a rule catalog needs a 'crops' mapping")
+    rules = catalog["crops"]
+    if region:
+        regions = catalog.get("regions") or {}
+        if region not in regions:
+            raise ValueError(f"{path}: unknown region {region!r}")
+        rules = _merge(rules, regions[region])
+    errors = validate_rules(rules)
+    if errors:
+        raise ValueError(f"{path}: invalid rule catalog: " + "; ".join(errors))
+    return rules
+
+
+ROTATION_RULES = load_catalog()
+
+
+def rotation_options(crop, climate, soil_type, season, past_crops, rank=None, rules=ROTATION_RULES):
+    table = compile_rules(rules)
+    crop_id = table.crop_ids.get(crop)
+    if crop_id is None:
+        return table.unsupported
+
+    option_ids, allowed, names = table.options_for(crop_id, climate, soil_type, season)
+    recent = 0
+    for past in past_crops[-2:]:
+        i = table.candidate_ids.get(past)
+        if i is not None:
+            recent |= 1 << i
+    if allowed & recent:
+        allowed &= ~recent
+        valid_options = [table.candidates[i] for i in option_ids if allowed >> i & 1]
+    else:
+        valid_options = list(names)
+    if rank is not None:
+        valid_options = rank(crop, valid_options)
+    if not valid_options:
+        return NO_OPTIONS
+    return valid_options
+
+
+# Compiled form of a rule dict. Every crop name gets an integer ID (its bit in
+# the masks): options[(crop, climate, soil, season)] is the option IDs in rule
+# order plus their bitmask and avoid_mask[crop] the avoid list, so filtering a
+# suggestion is a few integer ops. For the vectorised batch path,
+# position[crop, climate, soil, season, candidate] is the candidate's index in
+# the option list (or -1) and avoid[crop, candidate] flags the avoid list; the
+# last soil/season slots stand for values the rules do not know: soil falls back
+# to "Loamy", season to no options.
+class CompiledRules:
+    def __init__(self, rules):
+        self.rules = rules
+        self.crops = list(rules)
+        self.unsupported = unsupported_message(self.crops)
+        soils, seasons, candidates = [], [], []
+        for crop, by_climate in rules.items():
+            for climate in CLIMATES:
+                for soil, by_season in by_climate[climate].items():
+                    soils.append(soil)
+                    for season, options in by_season.items():
+                        seasons.append(season)
+                        candidates.extend(options)
+            candidates.extend(by_climate["avoid"])
+        self.soils = list(dict.fromkeys(soils))
+        self.seasons = list(dict.fromkeys(seasons))
+        self.candidates = list(dict.fromkeys(candidates))
+        self.crop_ids = {c: i for i, c in enumerate(self.crops)}
+        self.candidate_ids = {c: i for i, c in enumerate(self.candidates)}
+        self.soil_ids = {s: i for i, s in enumerate(self.soils)}
+
+        shape = (len(self.crops), len(CLIMATES), len(self.soils) + 1, len(self.seasons) + 1, len(self.candidates))
+        self.position = np.full(shape, -1, dtype=np.int16)
+        self.avoid = np.zeros((len(self.crops), len(self.candidates)), dtype=bool)
+        self.max_options = 0
+        for c, crop in enumerate(self.crops):
+            for k, climate in enumerate(CLIMATES):
+                by_soil = rules[crop][climate]
+                for s, soil in enumerate(self.soils + [None]):
+                    by_season = by_soil.get(soil, by_soil["Loamy"])
+                    for n, season in enumerate(self.seasons):
+                        options = by_season.get(season, [])
+                        self.max_options = max(self.max_options, len(options))
+                        for p, option in enumerate(options):
+                            self.position[c, k, s, n, self.candidate_ids[option]] = p
+            for option in rules[crop]["avoid"]:
+                self.avoid[c, self.candidate_ids[option]] = True
+
+        # (option IDs, bitmask of the options not on the avoid list, their names)
+        self.avoid_mask = [self.mask_of(rules[crop]["avoid"]) for crop in self.crops]
+        self.options = {}
+        for c, crop in enumerate(self.crops):
+            for climate in CLIMATES:
+                by_soil = rules[crop][climate]
+                for soil in self.soils:
+                    by_season = by_soil.get(soil, by_soil[FALLBACK_SOIL])
+                    for season, options in by_season.items():
+                        ids = tuple(self.candidate_ids[option] for option in options)
+                        allowed = self.mask_of(options) & ~self.avoid_mask[c]
+                        names = tuple(self.candidates[i] for i in ids if allowed >> i & 1)
+                        self.options[c, climate, soil, season] = (ids, allowed, names)
+
+    def __contains__(self, crop):
+        return crop in self.crop_ids
+
+    def mask_of(self, names):
+        mask = 0
+        for name in names:
+            i = self.candidate_ids.get(name)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def options_for(self, crop_id, climate, soil_type, season):
+        found = self.options.get((crop_id, climate, soil_type, season))
+        if found is not None:
+            return found
+        if climate not in CLIMATES:
+            raise KeyError(climate)
+        if soil_type not in self.soil_ids:
+            soil_type = FALLBACK_SOIL
+        return self.options.get((crop_id, climate, soil_type, season), NO_MASK)
+
+    def codes(self, values, known):
+        codes = pd.Categorical(values, categories=known).codes.astype(np.intp)
+        codes[codes < 0] = len(known)
+        return codes
+
+
+_compiled = {}
+
+
+def compile_rules(rules=ROTATION_RULES):
+    cached = _compiled.get(id(rules))
+    if cached is not None and cached[0] is rules:
+        return cached[1]
+    if isinstance(rules, CompiledRules):
+        return rules
+    if isinstance(rules, RuleCatalog):
+        return rules.current()
+    table = CompiledRules(rules)
+    _compiled[id(rules)] = (rules, table)
+    return table
+
+
+# A catalog file that is re-read when it changes (checked at most every
+# RELOAD_INTERVAL seconds), so rules can be edited without restarting the app.
+# A broken edit is reported in .error and the last good rules stay in use.
+class RuleCatalog:
+    def __init__(self, path=RULES_PATH, region=None, interval=RELOAD_INTERVAL):
+        self.path = path
+        self.region = region
+        self.interval = interval
+        self.error = None
+        self._lock = threading.Lock()
+        self._stamp = self._stat()
+        self._table = CompiledRules(load_catalog(path, region))
+        self._checked = time.monotonic()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def current(self):
+        if time.monotonic() - self._checked >= self.interval:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.interval:
+                    self._reload()
+        return self._table
+
+    def _reload(self):
+        self._checked = time.monotonic()
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return
+        self._stamp = stamp
+        try:
+            self._table = CompiledRules(load_catalog(self.path, self.region))
+            self.error = None
+        except Exception as exc:  # e.g. a half-saved file; retried on the next change
+            self.error = str(exc)
+            logger.warning("Keeping the previous rotation rules: %s", exc)
+
+    @property
+    def rules(self):
+        return self.current().rules
+
+
+# Vectorised suggest_rotation over a frame of fields with crop, location,
+# soil_type and season columns. Climate and recent history are resolved once
+# per distinct location and feedback scores once per distinct ranking context;
+# the result is a copy of the frame with a "suggestions" column holding exactly
+# what rotation_options would return for each row.
+def suggest_rotation_batch(fields, climate_of, recent_crops, feedback_model=None, by_context=False, rules=ROTATION_RULES):
+    table = compile_rules(rules)
+    result = fields.copy()
+    if result.empty:
+        result["suggestions"] = pd.Series(dtype=object)
+        return result
+    n_candidates = len(table.candidates)
+
+    location_codes, locations = pd.factorize(result["location"], use_na_sentinel=False)
+    location_climate = np.array([CLIMATES.index(climate_of(loc)) for loc in locations], dtype=np.intp)
+    recent = np.zeros((len(locations), n_candidates), dtype=bool)
+    for i, loc in enumerate(locations):
+        for past in recent_crops(loc)[-2:]:
+            if past in table.candidate_ids:
+                recent[i, table.candidate_ids[past]] = True
+
+    crop = table.codes(result["crop"], table.crops)
+    supported = crop < len(table.crops)
+    crop_idx = np.where(supported, crop, 0)
+    climate = location_climate[location_codes]
+    soil = table.codes(result["soil_type"], table.soils)
+    season = table.codes(result["season"], table.seasons)
+
+    position = table.position[crop_idx, climate, soil, season].astype(np.int32)
+    valid = (position >= 0) & ~table.avoid[crop_idx] & ~recent[location_codes]
+
+    score = np.zeros(position.shape)
+    if feedback_model is not None:
+        if by_context:
+            keys = pd.MultiIndex.from_arrays([result["crop"], np.array(CLIMATES)[climate], result["soil_type"], result["season"]])
+        else:
+            keys = pd.Index(result["crop"])
+        group_codes, groups = pd.factorize(keys)
+        group_scores = np.zeros((len(groups), n_candidates))
+        for g, key in enumerate(groups):
+            crop_name, context = (key[0], tuple(key[1:])) if by_context else (key, None)
+            scores, default = feedback_model.ranking_scores(crop_name, context)
+            if scores:
+                group_scores[g] = [scores.get(c, default) for c in table.candidates]
+        score = group_scores[group_codes]
+
+    # Highest score first, ties broken by the rule's option order (sorted() is stable)
+    position = np.where(valid, position, np.iinfo(np.int32).max)
+    order = np.lexsort((position, np.where(valid, -score, np.inf)), axis=-1)
+    order = order[:, :max(table.max_options, 1)]
+    ranked = np.where(np.take_along_axis(valid, order, axis=1), order, -1)
+
+    # Identical rankings share one materialised list
+    base = n_candidates + 1
+    if base ** ranked.shape[1] < np.iinfo(np.int64).max:
+        weights = base ** np.arange(ranked.shape[1], dtype=np.int64)
+        inverse, unique_keys = pd.factorize((ranked + 1) @ weights)
+        unique_rows = unique_keys[:, None] // weights % base - 1
+    else:
+        unique_rows, inverse = np.unique(ranked, axis=0, return_inverse=True)
+    candidates = np.array(table.candidates, dtype=object)
+    materialised = np.empty(len(unique_rows), dtype=object)
+    for u, row in enumerate(unique_rows):
+        chosen = row[row >= 0]
+        materialised[u] = candidates[chosen].tolist() if len(chosen) else NO_OPTIONS
+    suggestions = materialised[inverse.reshape(-1)]
+    suggestions[~supported] = table.unsupported
+    result["suggestions"] = suggestions
+    return result
+
+
+# Validate a catalog (and optionally one regional variant) before deploying it:
+#   python -m crop_rotation.rules rules.yaml --region punjab
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate and compile a rotation rule catalog")
+    parser.add_argument("path", nargs="?", default=RULES_PATH)
+    parser.add_argument("--region")
+    args = parser.parse_args()
+    try:
+        table = CompiledRules(load_catalog(args.path, args.region))
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    print(f"{args.path}: {len(table.crops)} crops, {len(table.candidates)} crop IDs, {len(table.soils)} soils, "
+          f"{len(table.seasons)} seasons, {len(table.options)} option sets")
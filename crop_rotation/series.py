@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .climate import _normalise, classify
+
+DAY = 86400
+BINS = 101  # whole-percent humidity, 0..100
+
+logger = logging.getLogger("crop_rotation.series")
+
+
+def _bin(humidity):
+    return min(BINS - 1, max(0, int(round(humidity))))
+
+
+def _median(hist, n):
+    # Middle one or two values of n counts spread over the bins
+    lo_rank, hi_rank = (n - 1) // 2, n // 2
+    seen, lo = 0, None
+    for value, count in enumerate(hist):
+        if not count:
+            continue
+        seen += count
+        if lo is None and seen > lo_rank:
+            lo = value
+        if seen > hi_rank:
+            return (lo + value) / 2
+
+
+# One location: the latest raw readings, daily humidity means for the
+# retention period and a histogram of the daily means inside the rolling
+# window, so the window median is a scan over 101 bins however much history
+# there is.
+class _Series:
+    __slots__ = ("raw", "days", "window", "hist", "median")
+
+    def __init__(self, raw_points):
+        self.raw = deque(maxlen=raw_points)  # (timestamp, humidity, temp)
+        self.days = deque()  # [day, humidity_sum, count]
+        self.window = deque()  # (day, bin) of the daily means in the window
+        self.hist = [0] * BINS
+        self.median = None
+
+    def add(self, timestamp, humidity, temp, window_days, retention_days):
+        if self.raw and timestamp <= self.raw[-1][0]:
+            return False  # already have this reading (or a newer one)
+        self.raw.append((timestamp, humidity, temp))
+        self.add_day(int(timestamp // DAY), humidity, 1, window_days, retention_days)
+        return True
+
+    def add_day(self, day, humidity_sum, count, window_days, retention_days):
+        if self.days and self.days[-1][0] == day:
+            bucket = self.days[-1]
+            bucket[1] += humidity_sum
+            bucket[2] += count
+            self.hist[self.window.pop()[1]] -= 1
+        else:
+            bucket = [day, humidity_sum, count]
+            self.days.append(bucket)
+            while self.days[0][0] <= day - retention_days:
+                self.days.popleft()
+            while self.window and self.window[0][0] <= day - window_days:
+                self.hist[self.window.popleft()[1]] -= 1
+        b = _bin(bucket[1] / bucket[2])
+        self.window.append((day, b))
+        self.hist[b] += 1
+        self.median = _median(self.hist, len(self.window))
+
+    @property
+    def last_day(self):
+        return self.days[-1][0]
+
+
+# Rolling store of periodic humidity readings per location (keyed by
+# normalised city name, like the weather cache). Raw readings are downsampled to
+# daily means kept for retention_days; the climate class is the median of the
+# daily means over the last window_days, refreshed on every write so reads are
+# a dict lookup. Per-location storage is bounded by raw_points + retention_days,
+# and at most max_locations are kept (least recently updated dropped first).
+class ClimateSeries:
+    def __init__(self, path=None, window_days=90, retention_days=365, min_days=3, raw_points=48,
+                 max_locations=4096):
+        if not 0 < window_days <= retention_days:
+            raise ValueError("window_days must be between 1 and retention_days")
+        self.path = path
+        self.window_days = window_days
+        self.retention_days = retention_days
+        self.min_days = min_days
+        self.raw_points = raw_points
+        self.max_locations = max_locations
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._series = OrderedDict()
+        self.load()
+
+    def __len__(self):
+        return len(self._series)
+
+    def __contains__(self, city):
+        return _normalise(city) in self._series
+
+    def locations(self):
+        with self._lock:
+            return list(self._series)
+
+    def _get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(self.raw_points)
+            while len(self._series) > self.max_locations:
+                self._series.popitem(last=False)
+        self._series.move_to_end(key)
+        return series
+
+    def add(self, city, timestamp, humidity, temp=None):
+        if humidity is None:
+            return False
+        with self._lock:
+            added = self._get(_normalise(city)).add(timestamp, humidity, temp, self.window_days, self.retention_days)
+            self.dirty |= added
+        return added
+
+    # (median daily humidity, days in the window) once the window holds at
+    # least min_days and its latest day is within the window of now
+    def summary(self, city, now=None):
+        series = self._series.get(_normalise(city))
+        if series is None or series.median is None:
+            return None
+        days = len(series.window)
+        today = int((time.time() if now is None else now) // DAY)
+        if days < self.min_days or series.last_day <= today - self.window_days:
+            return None
+        return series.median, days
+
+    def classify(self, city, now=None):
+        summary = self.summary(city, now)
+        return classify(summary[0]) if summary else None
+
+    def recent(self, city):
+        series = self._series.get(_normalise(city))
+        return list(series.raw) if series else []
+
+    def daily(self, city):
+        series = self._series.get(_normalise(city))
+        return [(day * DAY, total / count) for day, total, count in series.days] if series else []
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = {"locations": {
+                key: {"raw": list(series.raw), "days": [list(bucket) for bucket in series.days]}
+                for key, series in self._series.items()
+            }}
+            self.dirty = False
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+            locations = payload["locations"]
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("ignoring unreadable climate series %s", self.path)
+            return False
+        with self._lock:
+            self._series.clear()
+            for key, stored in locations.items():
+                series = self._get(key)
+                for day, humidity_sum, count in stored["days"]:
+                    series.add_day(day, humidity_sum, count, self.window_days, self.retention_days)
+                series.raw.extend(tuple(reading) for reading in stored["raw"])
+        return True
+
+
+# Background thread that samples every tracked location through lookup_many
+# every `interval` seconds (0 disables sampling) and writes the series to disk
+# at most every `flush_interval` seconds, so page renders never wait on either.
+class ClimateRefresher:
+    def __init__(self, series, lookup_many, interval=3600, flush_interval=60):
+        self.series = series
+        self.lookup_many = lookup_many
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.runs = 0
+        self._stop = threading.Event()
+        self._next_sample = time.monotonic() + interval
+        self._thread = threading.Thread(target=self._loop, name="climate-refresher", daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        locations = self.series.locations()
+        if locations:
+            self.lookup_many(locations)
+        self.runs += 1
+
+    def flush(self):
+        if self.series.dirty:
+            self.series.save()
+
+    def _loop(self):
+        wait = min(self.interval, self.flush_interval) if self.interval else self.flush_interval
+        while not self._stop.wait(wait):
+            try:
+                if self.interval and time.monotonic() >= self._next_sample:
+                    self._next_sample = time.monotonic() + self.interval
+                    self.sample()
+                self.flush()
+            except Exception:
+                logger.exception("climate refresh failed")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,293 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from . import config, service
+from .metrics import METRICS, span
+
+FIELD_KEYS = ["crop", "location", "soil_type", "season"]
+CONTEXT_KEYS = ["climate", "soil_type", "season"]
+MAX_BODY = 16 * 2**20
+MAX_FIELDS = 100_000
+VECTORISE_MIN = 128
+ROUTES = {"/health", "/metrics", "/climate", "/suggest", "/suggest/batch", "/crops", "/feedback"}
+
+logger = logging.getLogger("crop_rotation.server")
+
+
+class BadRequest(ValueError):
+    pass
+
+
+# At most `workers` tasks run at once; submit() blocks while all are busy, which
+# is what lets requests queue up in the batchers below
+class WorkerPool:
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service-worker")
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# Coalesces concurrent single requests into one call of fn(items) -> results.
+# Requests that arrive while the pool is busy (or within max_wait seconds of
+# the first one) share a batch of up to max_size, so an idle server adds no
+# latency and a loaded one does fewer, larger vectorised calls.
+class Batcher:
+    def __init__(self, name, fn, pool, max_size=256, max_wait=0.0):
+        self.name = name
+        self.fn = fn
+        self.pool = pool
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._queue = queue.SimpleQueue()
+        threading.Thread(target=self._dispatch, name=f"batch-{name}", daemon=True).start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            self.pool.submit(self._run, batch)
+
+    def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            with span("http_batch", endpoint=self.name):
+                results = self.fn(items)
+        except Exception as exc:
+            logger.exception("%s batch of %d failed", self.name, len(items))
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default of 5 refuses bursts of new clients
+
+
+def _text(payload, key, required=True):
+    value = payload.get(key)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or not value.strip():
+        raise BadRequest(f"'{key}' must be a non-empty string")
+    return value
+
+
+def _field(payload):
+    if not isinstance(payload, dict):
+        raise BadRequest("expected a JSON object")
+    return tuple(_text(payload, key) for key in FIELD_KEYS)
+
+
+def _feedback(payload):
+    if not isinstance(payload, dict):
+        raise BadRequest("expected a JSON object")
+    rating = payload.get("rating")
+    if isinstance(rating, str) or rating not in (0, 1):
+        raise BadRequest("'rating' must be 1 (useful) or 0 (not useful)")
+    notes = payload.get("notes") or ""
+    if not isinstance(notes, str):
+        raise BadRequest("'notes' must be a string")
+    return (_text(payload, "crop"), _text(payload, "suggestion"), int(rating), notes,
+            *(_text(payload, key, required=False) for key in CONTEXT_KEYS))
+
+
+# suggest_rotation returns either a list of crops or a message string
+def _suggestion(result):
+    if isinstance(result, str):
+        return {"suggestions": [], "message": result}
+    return {"suggestions": list(result), "message": None}
+
+
+# The vectorised batch has a fixed cost of a few ms, so small batches go
+# through suggest_rotation one field at a time (same results either way)
+def _suggest_many(fields):
+    if len(fields) < VECTORISE_MIN:
+        return [_suggestion(service.suggest_rotation(*field)) for field in fields]
+    planned = service.suggest_rotation_batch(pd.DataFrame(fields, columns=FIELD_KEYS))
+    return [_suggestion(result) for result in planned["suggestions"]]
+
+
+def _add_crops(rows):
+    service.add_crops(rows)
+    return [{"status": "recorded"}] * len(rows)
+
+
+def _add_feedbacks(rows):
+    service.add_feedbacks(rows)
+    return [{"status": "recorded"}] * len(rows)
+
+
+def _climate(city, live):
+    return service.get_climate_reading(city, live=live)._asdict()
+
+
+# JSON API over the same service functions as the Streamlit app. One process
+# shares the warm weather cache, history index, feedback model and rules
+# across all requests.
+class RotationService:
+    def __init__(self, workers=None, batch_max=None, batch_wait=None):
+        workers = workers or config.SERVICE_WORKERS
+        batch_max = batch_max or config.SERVICE_BATCH_MAX
+        batch_wait = config.SERVICE_BATCH_WAIT_MS / 1000 if batch_wait is None else batch_wait
+        self.pool = WorkerPool(workers)
+        self.suggest = Batcher("suggest", _suggest_many, self.pool, batch_max, batch_wait)
+        self.crops = Batcher("crops", _add_crops, self.pool, batch_max, batch_wait)
+        self.feedback = Batcher("feedback", _add_feedbacks, self.pool, batch_max, batch_wait)
+
+    def warm(self):
+        service.get_rule_catalog()
+        service.get_feedback_model()
+        service.history_rollups()  # indexes the history for recent_crops
+        service.get_weather_client()
+        service.start_climate_refresher()
+        if config.CLIMATE_MODE == "offline":
+            service.get_offline_climate()
+
+    def handle(self, method, path, query, payload):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "workers": self.pool.workers}
+        if method == "GET" and path == "/climate":
+            city = (query.get("city") or [""])[0]
+            if not city.strip():
+                raise BadRequest("'city' query parameter is required")
+            live = (query.get("live") or ["0"])[0].lower() in ("1", "true", "yes")
+            return 200, self.pool.submit(_climate, city, live).result()
+        if method == "POST" and path == "/suggest":
+            return 200, self.suggest.submit(_field(payload)).result()
+        if method == "POST" and path == "/suggest/batch":
+            fields = payload.get("fields") if isinstance(payload, dict) else None
+            if not isinstance(fields, list) or not 0 < len(fields) <= MAX_FIELDS:
+                raise BadRequest(f"'fields' must be a list of 1 to {MAX_FIELDS:,} fields")
+            return 200, {"results": self.pool.submit(_suggest_many, [_field(f) for f in fields]).result()}
+        if method == "POST" and path == "/crops":
+            return 201, self.crops.submit(_field(payload)).result()
+        if method == "POST" and path == "/feedback":
+            return 201, self.feedback.submit(_feedback(payload)).result()
+        return 404, {"error": f"no route for {method} {path}"}
+
+    def make_server(self, host, port):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive for clients that reuse connections
+            disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+            def _reply(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                path = url.path.rstrip("/") or "/"
+                if method == "GET" and path == "/metrics":
+                    self._reply(200, METRICS.prometheus().encode(), "text/plain; version=0.0.4")
+                    return
+                endpoint = path if path in ROUTES else "other"
+                with span("http_request", endpoint=endpoint, method=method) as labels:
+                    try:
+                        payload = None
+                        length = int(self.headers.get("Content-Length") or 0)
+                        if length > MAX_BODY:
+                            self.close_connection = True
+                            raise BadRequest(f"request body over {MAX_BODY // 2**20} MB")
+                        if length:
+                            try:
+                                payload = json.loads(self.rfile.read(length))
+                            except ValueError:
+                                raise BadRequest("request body is not valid JSON")
+                        status, body = api.handle(method, path, parse_qs(url.query), payload)
+                    except BadRequest as exc:
+                        status, body = 400, {"error": str(exc)}
+                    except Exception as exc:
+                        logger.exception("%s %s failed", method, path)
+                        status, body = 500, {"error": type(exc).__name__}
+                    labels["status"] = str(status)
+                self._reply(status, body)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Server((host, port), Handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve rotation suggestions, history and feedback as a JSON API")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=config.SERVICE_WORKERS)
+    parser.add_argument("--batch-max", type=int, default=config.SERVICE_BATCH_MAX,
+                        help="most single requests coalesced into one call (1 disables batching)")
+    parser.add_argument("--batch-wait-ms", type=float, default=config.SERVICE_BATCH_WAIT_MS,
+                        help="extra time to wait for a batch to fill")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    api = RotationService(args.workers, args.batch_max, args.batch_wait_ms / 1000)
+    api.warm()
+    server = api.make_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} with {args.workers} workers", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.pool.shutdown()
+        service.reset()
+
+
+#   python -m crop_rotation.server --port 8000
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import io
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from . import config, export, rules
+from .climate import WeatherClient
+from .feedback import FeedbackModel
+from .gazetteer import OfflineClimate
+from .metrics import METRICS, span, timed
+from .planner import RotationPlanner, SEASON_CYCLE
+from .series import ClimateRefresher, ClimateSeries
+from .storage import make_backend
+
+# Process-wide instances, created on first use. Streamlit re-executes app.py on
+# every rerun but not the modules it imports, so these live for the process.
+_instances = {}
+_lock = threading.RLock()
+
+
+def _shared(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = factory()
+    return instance
+
+
+def reset():
+    with _lock:
+        refresher = _instances.pop("climate_refresher", None)
+        if refresher is not None:
+            refresher.stop()
+        series = _instances.get("climate_series")
+        if series is not None and series.dirty:
+            series.save()
+        client = _instances.pop("weather", None)
+        if client is not None:
+            client.close()
+        _instances.clear()
+
+
+def get_weather_client():
+    return _shared("weather", lambda: WeatherClient(
+        config.API_KEY, config.WEATHER_URL, ttl=config.WEATHER_TTL, disk_path=config.WEATHER_CACHE,
+        on_reading=_record_reading if config.CLIMATE_WINDOW_DAYS else None
+    ))
+
+
+def get_climate_series():
+    return _shared("climate_series", lambda: ClimateSeries(
+        config.CLIMATE_SERIES or None, config.CLIMATE_WINDOW_DAYS, config.CLIMATE_RETENTION_DAYS,
+        config.CLIMATE_MIN_DAYS
+    ))
+
+
+def _record_reading(key, reading, fetched_at):
+    get_climate_series().add(key, fetched_at, reading[3], reading[4])
+
+
+# Samples the tracked locations in the background (with an API key) and
+# writes the series to disk; a no-op when rolling classification is off
+def start_climate_refresher():
+    if not config.CLIMATE_WINDOW_DAYS:
+        return None
+    interval = config.CLIMATE_SAMPLE_INTERVAL if config.API_KEY else 0
+    return _shared("climate_refresher", lambda: ClimateRefresher(
+        get_climate_series(),
+        lambda cities: get_weather_client().lookup_many(cities, concurrency=config.WEATHER_CONCURRENCY),
+        interval
+    ))
+
+
+def get_storage():
+    return _shared("storage", lambda: make_backend(
+        config.STORAGE_BACKEND, config.HISTORY_CSV, config.FEEDBACK_CSV, config.STORAGE_DB
+    ))
+
+
+def _load_feedback_model():
+    model = FeedbackModel(config.FEEDBACK_MODEL, config.FEEDBACK_HALF_LIFE_DAYS, config.FEEDBACK_RANKING)
+    if not model.load():
+        model.rebuild(get_storage().read_feedback(), replace=False)
+    return model
+
+
+def get_feedback_model():
+    return _shared("feedback_model", _load_feedback_model)
+
+
+def get_rule_catalog():
+    return _shared("rules", lambda: rules.RuleCatalog(config.RULES_PATH, config.RULES_REGION))
+
+
+# Crops, soils and seasons the current rules know, for the app's inputs
+def rule_choices():
+    table = rules.compile_rules(get_rule_catalog())
+    return table.crops, table.soils, table.seasons
+
+
+def get_planner():
+    return _shared("planner", lambda: RotationPlanner(
+        rules=get_rule_catalog(), feedback_model=get_feedback_model(), by_context=config.FEEDBACK_BY_CONTEXT
+    ))
+
+
+def _start_metrics():
+    METRICS.configure(config.METRICS_LOG, config.METRICS_PROM_FILE, config.METRICS_LOG_MAX_MB * 2**20,
+                      config.METRICS_PROM_INTERVAL)
+    return METRICS.serve(config.METRICS_PORT, config.METRICS_HOST) if config.METRICS_PORT else True
+
+
+def start_metrics():
+    return _shared("metrics", _start_metrics)
+
+
+def get_offline_climate():
+    return _shared("offline_climate", lambda: OfflineClimate.load(config.GAZETTEER_PATH, config.CLIMATE_NORMALS_PATH))
+
+
+def _use_offline(live):
+    return not live and config.CLIMATE_MODE == "offline"
+
+
+# Weather API readings take their humid/dry class from the median of the
+# location's recent daily humidity once the series has enough of it. That
+# includes fallbacks, so an API outage does not turn a tracked city into Delhi's class.
+def _smoothed(city, reading):
+    if config.CLIMATE_WINDOW_DAYS and reading.source in ("live", "cache", "stale", "fallback"):
+        climate = get_climate_series().classify(city)
+        if climate is not None and climate != reading.climate:
+            return reading._replace(climate=climate)
+    return reading
+
+
+# (median daily humidity, days) behind the location's class, or None
+def climate_trend(city):
+    return get_climate_series().summary(city) if config.CLIMATE_WINDOW_DAYS else None
+
+
+# Gazetteer + climate normals unless live data is asked for (or CLIMATE_MODE=live);
+# places the offline data cannot resolve still go to the weather API
+def get_climate_reading(city="Delhi", live=False):
+    with span("get_climate") as labels:
+        reading = get_offline_climate().lookup(city) if _use_offline(live) else None
+        if reading is None:
+            reading = _smoothed(city, get_weather_client().lookup(city))
+        labels["source"] = reading.source
+    return reading
+
+
+def get_climate(city="Delhi"):
+    return tuple(get_climate_reading(city)[:5])  # Falls back to Delhi coordinates
+
+
+@timed("get_climate_many")
+def get_climate_many(cities, concurrency=None, live=False):
+    readings = {}
+    if _use_offline(live):
+        offline = get_offline_climate()
+        readings = {city: reading for city in cities if (reading := offline.lookup(city)) is not None}
+    missing = [city for city in cities if city not in readings]
+    if missing:
+        fetched = get_weather_client().lookup_many(missing, concurrency=concurrency or config.WEATHER_CONCURRENCY)
+        readings.update((city, _smoothed(city, reading)) for city, reading in fetched.items())
+    return readings
+
+
+@timed("add_crop")
+def add_crop(crop, location, soil_type, season):
+    get_storage().add_crop(crop, location, soil_type, season)
+
+
+@timed("add_feedback")
+def add_feedback(crop, suggestion, rating, notes, climate=None, soil_type=None, season=None):
+    model = get_feedback_model()  # before the row is stored, so a first rebuild can't count it twice
+    get_storage().add_feedback(crop, suggestion, rating, notes)
+    model.record(crop, suggestion, rating, climate, soil_type, season)
+
+
+# Many add_crop / add_feedback calls in one append (or transaction) and one
+# feedback journal write; rows are tuples of the single-call arguments
+@timed("add_crops")
+def add_crops(rows):
+    date = datetime.now().strftime("%Y-%m-%d")
+    get_storage().add_crops([
+        {"date": date, "crop": crop, "location": location, "soil_type": soil_type, "season": season}
+        for crop, location, soil_type, season in rows
+    ])
+
+
+@timed("add_feedbacks")
+def add_feedbacks(rows):
+    model = get_feedback_model()
+    get_storage().add_feedbacks([
+        {"crop": crop, "suggestion": suggestion, "rating": rating, "notes": notes}
+        for crop, suggestion, rating, notes, *_ in rows
+    ])
+    model.record_many([
+        (crop, suggestion, rating, *(context + [None] * 3)[:3])
+        for crop, suggestion, rating, _, *context in rows
+    ])
+
+
+def read_history():
+    with span("read_history", backend=config.STORAGE_BACKEND):
+        return get_storage().read_history()
+
+
+def history_rollups():
+    with span("history_rollups", backend=config.STORAGE_BACKEND):
+        return get_storage().history_rollups()
+
+
+def history_page(page=0, page_size=50, **filters):
+    with span("history_page", backend=config.STORAGE_BACKEND):
+        return get_storage().history_page(page, page_size, **filters)
+
+
+# One row per field (location) for the all-fields map, taken from the rollups
+def field_summary(rollups=None):
+    storage = get_storage()
+    counts = (rollups or history_rollups())["location"]
+    return pd.DataFrame({
+        "location": list(counts),
+        "fields": list(counts.values()),
+        "last_crop": [(storage.recent_crops(location) or [None])[-1] for location in counts],
+    })
+
+
+def reset_history():
+    with span("reset_history", backend=config.STORAGE_BACKEND):
+        get_storage().reset_history()
+
+
+@timed("suggest_rotation")
+def suggest_rotation(crop, location, soil_type, season):
+    past_crops = get_storage().recent_crops(location)
+    climate, _, _, _, _ = get_climate(location)
+    context = (climate, soil_type, season) if config.FEEDBACK_BY_CONTEXT else None
+    rank = lambda c, options: get_feedback_model().rank(c, options, context)
+    return rules.rotation_options(crop, climate, soil_type, season, past_crops, rank, get_rule_catalog())
+
+
+@timed("suggest_rotation_batch")
+def suggest_rotation_batch(fields):
+    readings = get_climate_many(fields["location"].unique())
+    return rules.suggest_rotation_batch(
+        fields,
+        lambda location: readings[location].climate,
+        get_storage().recent_crops,
+        get_feedback_model(),
+        config.FEEDBACK_BY_CONTEXT,
+        get_rule_catalog()
+    )
+
+
+@timed("plan_rotation")
+def plan_rotation(crop, location, soil_type, season, years=3):
+    past_crops = get_storage().recent_crops(location)
+    climate, _, _, _, _ = get_climate(location)
+    return get_planner().plan(crop, climate, soil_type, season, past_crops, years)
+
+
+def plan_frame(crop, plans):
+    rows = []
+    for rank, plan in enumerate(plans, start=1):
+        for step, (season, next_crop) in enumerate(plan.steps):
+            rows.append({
+                "Current Crop": crop,
+                "Plan": rank,
+                "Plan Score": round(plan.score, 3),
+                "Year": step // len(SEASON_CYCLE) + 1,
+                "Season": season,
+                "Crop": next_crop,
+                "Date": datetime.now().strftime("%Y-%m-%d")
+            })
+    return pd.DataFrame(rows, columns=["Current Crop", "Plan", "Plan Score", "Year", "Season", "Crop", "Date"])
+
+
+def export_frame(frame, fmt="csv"):
+    buffer = io.BytesIO()
+    writer = export.PlanWriter(buffer, fmt)
+    writer.write(frame)
+    writer.close()
+    return buffer.getvalue()
+
+
+def history_fields(**filters):
+    with span("history_fields", backend=config.STORAGE_BACKEND):
+        return export.select_fields(export.latest_fields(get_storage().iter_history()), **filters)
+
+
+# Plans for every field in the history (optionally filtered) streamed chunk by
+# chunk into an in-memory file; nothing is written to a shared path
+@timed("export_plans")
+def export_plans(fmt="csv", years=3, chunksize=export.EXPORT_CHUNK, **filters):
+    fields = history_fields(**filters)
+    storage = get_storage()
+    planner = get_planner()
+    date = datetime.now().strftime("%Y-%m-%d")
+    buffer = io.BytesIO()
+    writer = export.PlanWriter(buffer, fmt)
+    try:
+        for start in range(0, len(fields), chunksize):
+            chunk = fields.iloc[start:start + chunksize]
+            readings = get_climate_many(chunk["location"].unique())
+            rows = []
+            for location, crop, soil_type, season in chunk.itertuples(index=False, name=None):
+                plans = planner.plan(crop, readings[location].climate, soil_type, season,
+                                     storage.recent_crops(location), years)
+                rows.extend(export.plan_rows(location, soil_type, season, crop, plans, date))
+            writer.write(pd.DataFrame(rows, columns=export.PLAN_COLUMNS))
+    finally:
+        writer.close(export.PLAN_COLUMNS)
+    buffer.seek(0)
+    return buffer, len(fields), writer.rows
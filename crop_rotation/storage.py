@@ -0,0 +1,238 @@
+import argparse
+import os
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+from .history import HistoryStore, FILTER_COLUMNS, HISTORY_COLUMNS, PAGE_SIZE, RECENT_WINDOW, empty_rollups
+
+FEEDBACK_COLUMNS = ["crop", "suggestion", "rating", "notes"]
+IMPORT_CHUNK = 50_000
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class CsvBackend:
+    name = "csv"
+
+    def __init__(self, history_path, feedback_path):
+        self.history_path = history_path
+        self.feedback_path = feedback_path
+        self._write_lock = threading.Lock()
+        self._history = HistoryStore(history_path)
+        if not os.path.exists(history_path):
+            pd.DataFrame(columns=HISTORY_COLUMNS).to_csv(history_path, index=False)
+        if not os.path.exists(feedback_path):
+            pd.DataFrame(columns=FEEDBACK_COLUMNS).to_csv(feedback_path, index=False)
+
+    def add_crops(self, rows):
+        frame = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+        with self._write_lock:
+            frame.to_csv(self.history_path, mode="a", header=False, index=False)
+
+    def add_feedbacks(self, rows):
+        frame = pd.DataFrame(rows, columns=FEEDBACK_COLUMNS)
+        with self._write_lock:
+            frame.to_csv(self.feedback_path, mode="a", header=False, index=False)
+
+    def read_history(self):
+        return pd.read_csv(self.history_path)
+
+    def iter_history(self, chunksize=IMPORT_CHUNK):
+        return pd.read_csv(self.history_path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+    def history_rollups(self):
+        return self._history.rollups()
+
+    def history_page(self, page=0, page_size=PAGE_SIZE, **filters):
+        rows, total = self._history.page(page, page_size, **filters)
+        return pd.DataFrame(rows, columns=HISTORY_COLUMNS), total
+
+    def read_feedback(self):
+        return pd.read_csv(self.feedback_path)
+
+    def recent_crops(self, location, n=RECENT_WINDOW):
+        return self._history.recent_crops(location)[-n:]
+
+    def reset_history(self):
+        with self._write_lock:
+            pd.DataFrame(columns=HISTORY_COLUMNS).to_csv(self.history_path, index=False)
+        self._history.invalidate()
+
+    def add_crop(self, crop, location, soil_type, season):
+        self.add_crops([{"date": _today(), "crop": crop, "location": location, "soil_type": soil_type, "season": season}])
+
+    def add_feedback(self, crop, suggestion, rating, notes):
+        self.add_feedbacks([{"crop": crop, "suggestion": suggestion, "rating": rating, "notes": notes}])
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    date TEXT, crop TEXT, location TEXT, soil_type TEXT, season TEXT
+);
+DROP INDEX IF EXISTS idx_history_location_date;
+CREATE INDEX IF NOT EXISTS idx_history_location_id ON history (location, id);
+CREATE TABLE IF NOT EXISTS history_rollup (
+    dimension TEXT, key TEXT, count INTEGER,
+    PRIMARY KEY (dimension, key)
+);
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    crop TEXT, suggestion TEXT, rating INTEGER, notes TEXT
+);
+DROP INDEX IF EXISTS idx_feedback_crop_suggestion;
+"""
+# Rollups for a database created before the history_rollup table existed
+ROLLUP_REBUILD = """
+INSERT INTO history_rollup (dimension, key, count)
+SELECT 'total', '', COUNT(*) FROM history HAVING COUNT(*) > 0
+UNION ALL SELECT 'crop', coalesce(crop, ''), COUNT(*) FROM history GROUP BY 2
+UNION ALL SELECT 'location', coalesce(location, ''), COUNT(*) FROM history GROUP BY 2
+UNION ALL SELECT 'season_soil', coalesce(season, '') || '|' || coalesce(soil_type, ''), COUNT(*) FROM history GROUP BY 2
+UNION ALL SELECT 'month', substr(coalesce(date, ''), 1, 7), COUNT(*) FROM history GROUP BY 2
+"""
+
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            if conn.execute("SELECT 1 FROM history_rollup LIMIT 1").fetchone() is None:
+                conn.execute(ROLLUP_REBUILD)
+
+    # One connection per thread; Streamlit serves each session from its own thread
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Rollups are updated in the same transaction as the rows they count
+    def add_crops(self, rows):
+        values = [tuple(row[c] for c in HISTORY_COLUMNS) for row in rows]
+        counts = Counter({("total", ""): len(values)})
+        for date, crop, location, soil_type, season in values:
+            counts.update((("crop", crop or ""), ("location", location or ""),
+                           ("season_soil", f"{season or ''}|{soil_type or ''}"), ("month", (date or "")[:7])))
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO history (date, crop, location, soil_type, season) VALUES (?, ?, ?, ?, ?)", values
+            )
+            conn.executemany(
+                "INSERT INTO history_rollup (dimension, key, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (dimension, key) DO UPDATE SET count = count + excluded.count",
+                [(dimension, key, n) for (dimension, key), n in counts.items()],
+            )
+
+    def add_feedbacks(self, rows):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO feedback (crop, suggestion, rating, notes) VALUES (?, ?, ?, ?)",
+                [tuple(row[c] for c in FEEDBACK_COLUMNS) for row in rows],
+            )
+
+    def read_history(self):
+        return pd.read_sql_query(f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history ORDER BY id", self._conn())
+
+    def iter_history(self, chunksize=IMPORT_CHUNK):
+        return pd.read_sql_query(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history ORDER BY id", self._conn(), chunksize=chunksize
+        )
+
+    def read_feedback(self):
+        return pd.read_sql_query(f"SELECT {', '.join(FEEDBACK_COLUMNS)} FROM feedback ORDER BY id", self._conn())
+
+    # Insertion order, like the CSV file, so back-filled records do not reorder a field's history
+    def recent_crops(self, location, n=RECENT_WINDOW):
+        rows = self._conn().execute(
+            "SELECT crop FROM history WHERE location = ? ORDER BY id DESC LIMIT ?", (location, n)
+        ).fetchall()
+        return [crop for (crop,) in reversed(rows)]
+
+    def history_rollups(self):
+        rollups = empty_rollups()
+        for dimension, key, count in self._conn().execute("SELECT dimension, key, count FROM history_rollup"):
+            if dimension == "total":
+                rollups["total"] = count
+            elif dimension == "season_soil":
+                rollups["season_soil"][tuple(key.split("|", 1))] = count
+            else:
+                rollups[dimension][key] = count
+        return rollups
+
+    def history_page(self, page=0, page_size=PAGE_SIZE, **filters):
+        columns = [column for column in FILTER_COLUMNS if filters.get(column) is not None]
+        where = " AND ".join(f"{column} = ?" for column in columns) or "1"
+        params = [filters[column] for column in columns]
+        conn = self._conn()
+        if columns:
+            total = conn.execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+        else:
+            total = self.history_rollups()["total"]
+        frame = pd.read_sql_query(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history WHERE {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+            conn, params=params + [page_size, page * page_size],
+        )
+        return frame, total
+
+    def reset_history(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM history")
+            conn.execute("DELETE FROM history_rollup")
+
+    def add_crop(self, crop, location, soil_type, season):
+        self.add_crops([{"date": _today(), "crop": crop, "location": location, "soil_type": soil_type, "season": season}])
+
+    def add_feedback(self, crop, suggestion, rating, notes):
+        self.add_feedbacks([{"crop": crop, "suggestion": suggestion, "rating": rating, "notes": notes}])
+
+    def import_csv(self, history_path=None, feedback_path=None, chunksize=IMPORT_CHUNK):
+        counts = {"history": 0, "feedback": 0}
+        for path, columns, insert, key in (
+            (history_path, HISTORY_COLUMNS, self.add_crops, "history"),
+            (feedback_path, FEEDBACK_COLUMNS, self.add_feedbacks, "feedback"),
+        ):
+            if not path or not os.path.exists(path):
+                continue
+            for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+                chunk = chunk.reindex(columns=columns)
+                if key == "feedback":
+                    chunk["rating"] = pd.to_numeric(chunk["rating"], errors="coerce")
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                insert(chunk.to_dict("records"))
+                counts[key] += len(chunk)
+        return counts
+
+
+def make_backend(kind=None, history_path="crop_history.csv", feedback_path="feedback.csv", db_path=None):
+    kind = (kind or os.getenv("STORAGE_BACKEND", "csv")).lower()
+    if kind == "sqlite":
+        return SqliteBackend(db_path or os.getenv("STORAGE_DB", "crop_rotation.db"))
+    if kind == "csv":
+        return CsvBackend(history_path, feedback_path)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+# One-shot import of existing CSV files into the SQLite backend:
+#   python -m crop_rotation.storage --db crop_rotation.db --history crop_history.csv --feedback feedback.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import crop history and feedback CSVs into SQLite")
+    parser.add_argument("--db", default=os.getenv("STORAGE_DB", "crop_rotation.db"))
+    parser.add_argument("--history", default="crop_history.csv")
+    parser.add_argument("--feedback", default="feedback.csv")
+    args = parser.parse_args()
+    counts = SqliteBackend(args.db).import_csv(args.history, args.feedback)
+    print(f"Imported {counts['history']} history rows and {counts['feedback']} feedback rows into {args.db}")
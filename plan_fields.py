@@ -0,0 +1,132 @@
+# Headless batch planner: streams a CSV of fields (crop, location, soil_type,
+# season) in chunks through the same rules, history and feedback ranking as
+# suggest_rotation, and writes suggestions incrementally to CSV, Parquet or Excel.
+#   python plan_fields.py fields.csv -o plans.csv --workers 4
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from crop_rotation import config, rules, service
+from crop_rotation.feedback import FeedbackModel
+from crop_rotation.storage import make_backend
+from crop_rotation.export import PlanWriter, format_for_path
+
+FIELD_COLUMNS = ["crop", "location", "soil_type", "season"]
+
+_feedback_model = None
+_by_context = False
+_rules = rules.ROTATION_RULES
+
+
+def _init_worker(model_path, method, half_life_days, by_context, catalog):
+    global _feedback_model, _by_context, _rules
+    _feedback_model = FeedbackModel(model_path, half_life_days, method)
+    if not _feedback_model.load():
+        _feedback_model = None
+    _by_context = by_context
+    _rules = rules.compile_rules(catalog)
+
+
+def _plan_chunk(chunk, climates, recent):
+    planned = rules.suggest_rotation_batch(
+        chunk, climates.__getitem__, lambda location: recent.get(location, []), _feedback_model, _by_context,
+        _rules
+    )
+    planned["suggestions"] = [s if isinstance(s, str) else ", ".join(s) for s in planned["suggestions"]]
+    return planned
+
+
+def run(args):
+    storage = make_backend(args.storage, args.history, args.feedback, args.db)
+    # Climate comes from the same service path as the app: offline data first,
+    # then the weather API with its cache and rolling per-location series
+    config.CLIMATE_MODE = args.climate_mode
+    model = FeedbackModel(args.feedback_model, args.half_life_days)
+    if not model.load():
+        model.rebuild(storage.read_feedback(), replace=False)
+    try:
+        catalog = rules.load_catalog(args.rules, args.region)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    init_args = (args.feedback_model, args.ranking, args.half_life_days, args.by_context, catalog)
+
+    writer = PlanWriter(args.output, args.format or format_for_path(args.output))
+    reader = pd.read_csv(args.input, chunksize=args.chunksize, dtype=str, keep_default_na=False)
+    started = time.perf_counter()
+    rows = 0
+
+    def submit(chunk):
+        locations = chunk["location"].unique()
+        climates = {city: reading.climate for city, reading in
+                    service.get_climate_many(locations, concurrency=args.weather_concurrency).items()}
+        recent = {location: storage.recent_crops(location) for location in locations}
+        return pool.submit(_plan_chunk, chunk, climates, recent) if pool else _plan_chunk(chunk, climates, recent)
+
+    def drain(result):
+        nonlocal rows
+        frame = result.result() if pool else result
+        writer.write(frame.astype(str))
+        rows += len(frame)
+        elapsed = time.perf_counter() - started
+        print(f"\r{rows:,} rows  {rows / elapsed:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+    pool = None
+    if args.workers > 0:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=init_args)
+    else:
+        _init_worker(*init_args)
+    try:
+        # At most two chunks per worker are in flight, so memory stays flat for any input size
+        in_flight = deque()
+        for chunk in reader:
+            missing = [c for c in FIELD_COLUMNS if c not in chunk.columns]
+            if missing:
+                raise SystemExit(f"{args.input} is missing columns: {', '.join(missing)}")
+            in_flight.append(submit(chunk))
+            while len(in_flight) > max(args.workers, 1) * 2:
+                drain(in_flight.popleft())
+        while in_flight:
+            drain(in_flight.popleft())
+    finally:
+        writer.close()
+        if pool:
+            pool.shutdown()
+        service.reset()
+    elapsed = time.perf_counter() - started
+    print(f"\nPlanned {rows:,} fields in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s) -> {args.output}",
+          file=sys.stderr)
+    return rows
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Plan crop rotations for a CSV of fields")
+    parser.add_argument("input", help="CSV with crop, location, soil_type and season columns")
+    parser.add_argument("-o", "--output", required=True, help="output .csv, .parquet or .xlsx file")
+    parser.add_argument("--format", choices=["csv", "parquet", "excel"])
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 plans in-process")
+    parser.add_argument("--climate-mode", default=os.getenv("CLIMATE_MODE", "offline"), choices=["offline", "live"],
+                        help="offline resolves places from the bundled gazetteer and climate normals first")
+    parser.add_argument("--rules", default=os.getenv("RULES_PATH", rules.RULES_PATH), help="JSON or YAML rule catalog")
+    parser.add_argument("--region", default=os.getenv("RULES_REGION") or None, help="regional variant in the catalog")
+    parser.add_argument("--weather-concurrency", type=int, default=int(os.getenv("WEATHER_CONCURRENCY", "8")))
+    parser.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "csv"), choices=["csv", "sqlite"])
+    parser.add_argument("--history", default="crop_history.csv")
+    parser.add_argument("--feedback", default="feedback.csv")
+    parser.add_argument("--db", default=os.getenv("STORAGE_DB", "crop_rotation.db"))
+    parser.add_argument("--feedback-model", default=os.getenv("FEEDBACK_MODEL", "feedback_model.json"))
+    parser.add_argument("--ranking", default=os.getenv("FEEDBACK_RANKING", "mean"))
+    parser.add_argument("--half-life-days", type=float, default=float(os.getenv("FEEDBACK_HALF_LIFE_DAYS", "0")) or None)
+    parser.add_argument("--by-context", action="store_true", default=os.getenv("FEEDBACK_BY_CONTEXT", "0") == "1")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()